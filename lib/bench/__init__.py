@@ -0,0 +1,4 @@
+#!/usr/bin/env python3
+
+from .harness import BenchmarkRunner
+from .workloads import WORKLOADS
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import argparse
+import tempfile
+
+import yaml
+
+from ..config import SlackBotConfig as conf
+from ..logging import SlackBotLogger as logger
+
+
+def int_list(value):
+    return [int(x) for x in value.split(',')]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        prog='python -m lib.bench',
+        description='Drive MockBot.handle_message with synthetic workloads'
+    )
+    parser.add_argument('-w', '--workloads', default='commands,triggers,contexts,mentions',
+                        help='comma separated workloads (commands,triggers,contexts,mentions,mixed)')
+    parser.add_argument('-u', '--users', type=int_list, default=[10, 1000], help='user directory sizes')
+    parser.add_argument('-p', '--plugins', type=int_list, default=[5, 50], help='synthetic plugin counts')
+    parser.add_argument('-c', '--contexts', type=int_list, default=[0, 100], help='open conversation counts')
+    parser.add_argument('-n', '--messages', type=int, default=2000, help='measured messages per run')
+    parser.add_argument('--warmup', type=int, default=100, help='unmeasured messages per run')
+    parser.add_argument('-t', '--threads', type=int, default=1, help='concurrent senders')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', help='write JSON results to this path')
+    return parser.parse_args()
+
+
+def build_config():
+    fd, path = tempfile.mkstemp(suffix='.yml', prefix='slackbot-bench-')
+    with os.fdopen(fd, 'w') as f:
+        yaml.safe_dump({
+            'core': {
+                'bot_name': 'mockbot',
+                'slack_token': 'bench',
+                'command_trigger': '!',
+                'enabled_plugins': [],
+            },
+            'logging': {'debug': False},
+        }, f)
+    return path
+
+
+def main():
+    args = parse_args()
+    config_path = build_config()
+    conf.build(config_path)
+    logger.build(conf)
+    os.unlink(config_path)
+
+    from .harness import BenchmarkRunner
+    from .workloads import WORKLOADS
+
+    workloads = args.workloads.split(',')
+    for name in workloads:
+        if name not in WORKLOADS:
+            sys.exit(f"Unknown workload: {name}")
+    runner = BenchmarkRunner(
+        messages=args.messages,
+        warmup=args.warmup,
+        threads=args.threads,
+        seed=args.seed
+    )
+    runner.run_matrix(workloads, args.users, args.plugins, args.contexts)
+    if args.output:
+        runner.write(args.output)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import platform
+import itertools
+from datetime import datetime
+from contextlib import redirect_stdout
+from concurrent.futures import ThreadPoolExecutor
+
+from ..core.mock import MockBot, RecordingClient
+from ..metrics import SlackBotMetrics as metrics
+from ..metrics import percentile
+from .plugins import CommandPlugin, ConversationPlugin, MentionPlugin, CONTEXT_PLUGIN_NAME
+from .workloads import WORKLOADS
+
+
+def summarize(latencies):
+    latencies = sorted(latencies)
+    return {
+        "count": len(latencies),
+        "mean_ms": sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": latencies[-1] * 1000 if latencies else 0.0,
+    }
+
+
+class BenchmarkRunner(object):
+
+    def __init__(self, messages=2000, warmup=100, threads=1, seed=0):
+        self.messages = messages
+        self.warmup = warmup
+        self.threads = threads
+        self.seed = seed
+        self.results = []
+
+    def _build_bot(self, users, plugins):
+        bot = MockBot()
+        client = RecordingClient()
+        bot.setup_mock(client=client, users=users)
+        for idx in range(plugins):
+            bot.plugins._register_plugin(f"benchcmd{idx}", CommandPlugin(bot, idx))
+        bot.plugins._register_plugin(CONTEXT_PLUGIN_NAME, ConversationPlugin(bot))
+        bot.plugins._register_plugin('chatterbot', MentionPlugin(bot))
+        return bot, client
+
+    def _teardown_bot(self, bot):
+        # Every bot registers a collector, a matrix run builds one per cell
+        bot.stop_event.set()
+        metrics.unregister_collector(bot._collect_metrics)
+
+    def _drive(self, bot, items):
+        latencies = {}
+
+        def send(item):
+            path, payload = item
+            start = time.perf_counter()
+            bot.handle_message(payload)
+            return path, time.perf_counter() - start
+
+        if self.threads > 1:
+            with ThreadPoolExecutor(max_workers=self.threads) as pool:
+                results = list(pool.map(send, items))
+        else:
+            results = [send(item) for item in items]
+        for path, latency in results:
+            latencies.setdefault(path, []).append(latency)
+        return latencies
+
+    def run(self, workload_name, users, plugins, contexts):
+        metrics.reset()
+        user_ids = [f"U{idx}" for idx in range(users)]
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            bot, client = self._build_bot(user_ids, plugins)
+            try:
+                workload = WORKLOADS[workload_name](user_ids, plugins, contexts, seed=self.seed)
+                for payload in workload.setup():
+                    bot.handle_message(payload)
+                self._drive(bot, list(workload.generate(self.warmup)))
+                client.reset()
+                items = list(workload.generate(self.messages))
+                start = time.perf_counter()
+                latencies = self._drive(bot, items)
+                elapsed = time.perf_counter() - start
+            finally:
+                self._teardown_bot(bot)
+        result = {
+            "workload": workload_name,
+            "users": users,
+            "plugins": plugins,
+            "contexts": contexts,
+            "threads": self.threads,
+            "messages": len(items),
+            "elapsed_s": elapsed,
+            "msgs_per_sec": len(items) / elapsed if elapsed else 0.0,
+            "slack_calls": dict(client.counts),
+            "paths": {path: summarize(values) for path, values in latencies.items()},
+        }
+        self.results.append(result)
+        return result
+
+    def run_matrix(self, workloads, users, plugins, contexts):
+        for workload, nusers, nplugins, ncontexts in itertools.product(workloads, users, plugins, contexts):
+            result = self.run(workload, nusers, nplugins, ncontexts)
+            self.print_result(result)
+        return self.results
+
+    def print_result(self, result):
+        print(
+            f"{result['workload']:<9} users={result['users']:<5} plugins={result['plugins']:<4} "
+            f"contexts={result['contexts']:<5} {result['msgs_per_sec']:>10.1f} msgs/sec"
+        )
+        for path, stats in sorted(result['paths'].items()):
+            print(
+                f"    {path:<8} n={stats['count']:<6} p50={stats['p50_ms']:.3f}ms "
+                f"p95={stats['p95_ms']:.3f}ms p99={stats['p99_ms']:.3f}ms"
+            )
+        sys.stdout.flush()
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump({
+                "meta": {
+                    "timestamp": datetime.now().isoformat(),
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "messages": self.messages,
+                    "warmup": self.warmup,
+                    "threads": self.threads,
+                    "seed": self.seed,
+                },
+                "runs": self.results,
+            }, f, indent=2)
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+from ..builtins import BasePlugin
+
+
+# Contexts are attributed to the directory of the module that opens them,
+# so the conversation plugin has to be registered under this name
+CONTEXT_PLUGIN_NAME = 'bench'
+
+
+class CommandPlugin(BasePlugin):
+
+    def __init__(self, client, idx):
+        self.hooks = [f"benchcmd{idx}"]
+        self.help_pages = [{f"benchcmd{idx}": f"benchcmd{idx} <args> - synthetic benchmark command"}]
+        self.trigger_regexes = [f"\\bzq{idx}x\\b"]
+        super().__init__(client)
+
+    def setUp(self):
+        pass
+
+    def on_recv(self, channel, user, cmd, words):
+        return f"{cmd} received {len(words)} arguments"
+
+    def on_trigger(self, channel, user, words):
+        return f"triggered by {len(words)} words"
+
+
+class ConversationPlugin(BasePlugin):
+
+    hooks = ['benchctx']
+
+    def setUp(self):
+        pass
+
+    def on_recv(self, channel, user, cmd, words):
+        ctx = self.client.contexts.new_context(channel, user['id'], timeout=3600)
+        ctx.set('turns', 0)
+        return "Conversation started"
+
+    def on_context(self, channel, user, ctx, words):
+        ctx.set('turns', ctx.get('turns') + 1)
+        return f"turn {ctx.get('turns')}: {' '.join(reversed(words))}"
+
+
+class MentionPlugin(BasePlugin):
+
+    # Stand-in for chatterbot that does a small, fixed amount of work
+    def setUp(self):
+        pass
+
+    def on_recv(self, channel, user, cmd, words):
+        longest = max(words, key=len) if words else ''
+        return f"Tell me more about {longest}"
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+import abc
+import random
+
+
+FILLER = "the build on staging is red again can someone take a look please".split()
+
+
+def _payload(channel, user, text):
+    return {"data": {"channel": channel, "user": user, "text": text}}
+
+
+def _sentence(rand, length=8):
+    return ' '.join(rand.choice(FILLER) for _ in range(length))
+
+
+class Workload(abc.ABC):
+
+    name = None
+
+    def __init__(self, users, plugins, contexts, seed=0):
+        self.users = users
+        self.plugins = plugins
+        self.contexts = contexts
+        self.rand = random.Random(seed)
+
+    def user(self):
+        return self.rand.choice(self.users)
+
+    def channel(self):
+        return f"CBENCH{self.rand.randrange(4)}"
+
+    def conversations(self, count=None):
+        # Open conversations live in their own channels so they only add
+        # to the size of the context index for the other workloads
+        count = self.contexts if count is None else count
+        return [(f"CCONV{idx // len(self.users)}", self.users[idx % len(self.users)]) for idx in range(count)]
+
+    def setup(self):
+        return [_payload(channel, user, "!benchctx") for channel, user in self.conversations()]
+
+    @abc.abstractmethod
+    def generate(self, count):
+        pass
+
+
+class CommandWorkload(Workload):
+
+    name = 'commands'
+
+    def generate(self, count):
+        for _ in range(count):
+            cmd = self.rand.randrange(self.plugins)
+            yield 'cmd', _payload(self.channel(), self.user(), f"!benchcmd{cmd} {_sentence(self.rand, 3)}")
+
+
+class TriggerWorkload(Workload):
+
+    name = 'triggers'
+
+    def generate(self, count):
+        for _ in range(count):
+            trigger = self.rand.randrange(self.plugins)
+            text = f"{_sentence(self.rand, 4)} zq{trigger}x {_sentence(self.rand, 4)}"
+            yield 'trigger', _payload(self.channel(), self.user(), text)
+
+
+class ContextWorkload(Workload):
+
+    name = 'contexts'
+
+    def conversations(self, count=None):
+        return super().conversations(max(self.contexts, 1) if count is None else count)
+
+    def generate(self, count):
+        conversations = self.conversations()
+        for _ in range(count):
+            channel, user = self.rand.choice(conversations)
+            yield 'context', _payload(channel, user, _sentence(self.rand, 6))
+
+
+class MentionWorkload(Workload):
+
+    name = 'mentions'
+
+    def generate(self, count):
+        for _ in range(count):
+            yield 'mention', _payload(self.channel(), self.user(), f"<@mockbot> {_sentence(self.rand, 6)}")
+
+
+class MixedWorkload(Workload):
+
+    name = 'mixed'
+
+    def __init__(self, users, plugins, contexts, seed=0):
+        super().__init__(users, plugins, contexts, seed)
+        self.parts = [
+            part(users, plugins, contexts, seed + idx + 1)
+            for idx, part in enumerate([CommandWorkload, TriggerWorkload, ContextWorkload, MentionWorkload])
+        ]
+
+    def setup(self):
+        return self.parts[2].setup()
+
+    def generate(self, count):
+        streams = [part.generate(count) for part in self.parts]
+        for _ in range(count):
+            yield next(self.rand.choice(streams))
+
+
+WORKLOADS = {
+    x.name: x for x in [CommandWorkload, TriggerWorkload, ContextWorkload, MentionWorkload, MixedWorkload]
+}
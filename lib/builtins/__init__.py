@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 
 from .builtins import BuiltInHelp, BuiltInReload, BuiltInRestart, \
-                      BuiltInShutdown, BuiltInGreet, BuiltInSource, BasePlugin
+                      BuiltInShutdown, BuiltInGreet, BuiltInSource, BuiltInStats, \
+                      BuiltInProfile, BuiltInMemory, BasePlugin
 
 
 BUILTIN_PLUGINS = {
@@ -11,4 +12,7 @@ BUILTIN_PLUGINS = {
     'shutdown': BuiltInShutdown,
     'greet': BuiltInGreet,
     'source': BuiltInSource,
+    'stats': BuiltInStats,
+    'profile': BuiltInProfile,
+    'memory': BuiltInMemory,
 }
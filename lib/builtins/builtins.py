@@ -5,6 +5,8 @@ from time import sleep
 import os
 import re
 
+from ..metrics import SlackBotMetrics as metrics
+
 basedir = dir_path = os.path.dirname(os.path.realpath(__file__))
 with open(os.path.join(basedir, '..', '..', '.git', 'config'), 'r') as f:
     git_config = f.read()
@@ -101,12 +103,33 @@ class BuiltInReload(BasePlugin):
                 {"reload": "reload <users|config|plugins>\n\
                         Users - Slack User Database\n\
                         Config - Bot YAML Configuration\n\
-                        Plugins - Bot Plugins"}
+                        Plugins - Bot Plugins (re-imports and sets up every plugin)"}
             ]
 
     def on_recv(self, channel, user, cmd, words):
         if cmd == 'reload':
-            return "This functionality is broken at the moment"
+            if not self.client.is_admin(user['id']):
+                return "Only admins can reload the bot"
+            if not words or words[0].lower() not in ['users', 'config', 'plugins']:
+                return self.client.get_help_page('reload')
+            target = words[0].lower()
+            if target == 'plugins':
+                # Runs every setUp again, so don't hold the message thread
+                Thread(target=self.reload_in_background, args=[channel, target], daemon=True).start()
+                return "Reloading plugins, the current ones keep running until it's done"
+            return self.reload(target)
+
+    def reload(self, target):
+        result = self.client.reload(target)
+        if result is None:
+            return "A reload is already running"
+        ok, elapsed = result
+        if not ok:
+            return "Failed to reload %s, keeping the current ones" % target
+        return "Reloaded %s in %.1fms" % (target, elapsed * 1000)
+
+    def reload_in_background(self, channel, target):
+        self.client.send_channel_message(channel, self.reload(target))
 
 
 class BuiltInSource(BasePlugin):
@@ -126,6 +149,92 @@ class BuiltInSource(BasePlugin):
             return "View my source @ %s" % SOURCE
 
 
+class BuiltInProfile(BasePlugin):
+
+    hooks = ['profile']
+    help_pages = [
+                {"profile": "profile <deterministic|sampling> [<N> | <T>s] - Profiles the next N messages or T seconds\n\
+                        profile status - Shows the running profile\n\
+                        profile stop - Stops profiling and posts the report"}
+            ]
+
+    def on_recv(self, channel, user, cmd, words):
+        if cmd != 'profile':
+            return
+        if not self.client.is_admin(user['id']):
+            return "Sorry, only admins can do that"
+        if len(words) == 0:
+            return self.client.get_help_page('profile')
+        profiler = self.client.profiler
+        if words[0] == 'status':
+            return profiler.status()
+        if words[0] == 'stop':
+            if not profiler.stop():
+                return "Profiling is not running"
+            return
+        if words[0] not in ['deterministic', 'sampling']:
+            return self.client.get_help_page('profile')
+        messages = None
+        seconds = None
+        try:
+            if len(words) > 1 and words[1].endswith('s'):
+                seconds = float(words[1][:-1])
+            elif len(words) > 1:
+                messages = int(words[1])
+            else:
+                messages = 100
+        except ValueError:
+            return self.client.get_help_page('profile')
+        if (messages is not None and messages <= 0) or (seconds is not None and seconds <= 0):
+            return "The number of messages or seconds has to be greater than 0"
+        if not profiler.start(channel, words[0], messages=messages, seconds=seconds):
+            return "Profiling is already running"
+        if seconds:
+            return "Profiling for the next %s seconds" % words[1][:-1]
+        return "Profiling the next %d messages" % messages
+
+
+class BuiltInMemory(BasePlugin):
+
+    hooks = ['memory']
+    help_pages = [
+                {"memory": "memory [status] - Shows RSS and sizes of users, contexts, kv subjects and plugin collections\n\
+                        memory start [frames] - Starts tracing allocations\n\
+                        memory snapshot [N] - Shows the top N allocation sites by plugin since the last snapshot\n\
+                        memory stop - Stops tracing allocations"}
+            ]
+
+    def on_recv(self, channel, user, cmd, words):
+        if cmd != 'memory':
+            return
+        if not self.client.is_admin(user['id']):
+            return "Sorry, only admins can do that"
+        memory = self.client.memory
+        action = words[0].lower() if words else 'status'
+        try:
+            arg = int(words[1]) if len(words) > 1 else None
+        except ValueError:
+            return self.client.get_help_page('memory')
+        if action == 'status':
+            return "```\n%s\n```" % memory.status()
+        if action == 'start':
+            if not memory.start(arg or 10):
+                if memory.tracing():
+                    return "Allocations are already being traced"
+                return "Something else is tracing allocations, e.g. the startup report, try again later"
+            return "Tracing allocations, run `memory snapshot` later to see what grew"
+        if action == 'snapshot':
+            report = memory.report(arg or 10)
+            if report is None:
+                return "Allocations are not being traced, run `memory start` first"
+            return "```\n%s\n```" % report
+        if action == 'stop':
+            if not memory.stop():
+                return "Allocations are not being traced"
+            return "Stopped tracing allocations"
+        return self.client.get_help_page('memory')
+
+
 class BuiltInRestart(BasePlugin):
 
     hooks = ['restart']
@@ -173,3 +282,39 @@ class BuiltInGreet(BasePlugin):
                         user_profile['real_name']
                         )
                 return response
+
+
+class BuiltInStats(BasePlugin):
+
+    hooks = ['stats']
+    help_pages = [
+                {"stats": "stats - Shows call counts and latencies per plugin and dispatch path"}
+            ]
+
+    def _format_histograms(self, title, name, label_names):
+        rows = []
+        for key, (count, total, p50, p95) in sorted(metrics.get_histograms(name).items()):
+            labels = dict(key)
+            label = '/'.join(labels.get(x) or '-' for x in label_names)
+            rows.append("%-32s %8d %9.1f %9.1f %9.1f" % (
+                label, count, total / count * 1000, p50 * 1000, p95 * 1000
+            ))
+        if not rows:
+            return []
+        header = "%-32s %8s %9s %9s %9s" % (title, 'count', 'mean ms', 'p50 ms', 'p95 ms')
+        return [header] + rows + ['']
+
+    def on_recv(self, channel, user, cmd, words):
+        if cmd == 'stats':
+            metrics.collect()
+            lines = []
+            lines += self._format_histograms('message path', 'slackbot_message_seconds', ['path'])
+            lines += self._format_histograms('plugin/path', 'slackbot_plugin_seconds', ['plugin', 'path'])
+            lines += self._format_histograms('slack api', 'slackbot_slack_api_seconds', ['method'])
+            lines += self._format_histograms('loop lag', 'slackbot_loop_lag_seconds', ['loop'])
+            contexts = metrics.get_values('slackbot_active_contexts')
+            active = ', '.join(
+                '%s=%d' % (dict(k).get('plugin'), v) for k, v in sorted(contexts.items()) if v
+            )
+            lines.append("active contexts: %s" % (active or 'none'))
+            return "```\n%s\n```" % '\n'.join(lines)
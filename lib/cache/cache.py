@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+import time
+import threading
+from collections import OrderedDict
+
+
+class TTLCache(object):
+    # Stale entries are kept until evicted by size so callers can still
+    # fall back to them with get(..., allow_stale=True)
+
+    def __init__(self, maxsize=256, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.data = OrderedDict()
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def get(self, key, default=None, allow_stale=False):
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if expires <= time.monotonic() and not allow_stale:
+                return default
+            self.data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (ttl if ttl is not None else self.ttl)
+        with self.lock:
+            self.data[key] = (expires, value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def add(self, key, value, ttl=None):
+        # Atomic check-and-set, False if the key is already live
+        now = time.monotonic()
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is not None and entry[0] > now:
+                return False
+            self.data[key] = (now + (ttl if ttl is not None else self.ttl), value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+            return True
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+class _Call(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    # Concurrent calls sharing a key run once; every waiter gets the same
+    # result (or exception)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, function, *args, **kwargs):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self.calls[key] = call
+        if not leader:
+            call.done.wait()
+        else:
+            try:
+                call.result = function(*args, **kwargs)
+            except Exception as err:
+                call.error = err
+            finally:
+                with self.lock:
+                    del self.calls[key]
+                call.done.set()
+        if call.error is not None:
+            raise call.error
+        return call.result
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import socket
+import sqlite3
+import hashlib
+import threading
+from bisect import bisect
+
+from ..config import SlackBotConfig as config
+from ..logging import SlackBotLogger as logger
+from ..metrics import SlackBotMetrics as metrics
+
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS members (
+        instance_id TEXT PRIMARY KEY,
+        heartbeat REAL NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS leader (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        instance_id TEXT NOT NULL,
+        expires REAL NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS events (
+        event_id TEXT PRIMARY KEY,
+        expires REAL NOT NULL
+    )""",
+]
+
+
+def hash_key(key):
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+
+class HashRing(object):
+
+    def __init__(self, members, vnodes=64):
+        self.members = tuple(sorted(members))
+        points = sorted(
+            (hash_key(f"{member}#{idx}"), member)
+            for member in self.members for idx in range(vnodes)
+        )
+        self.keys = [x[0] for x in points]
+        self.owners = [x[1] for x in points]
+
+    def owner(self, key):
+        if not self.keys:
+            return None
+        idx = bisect(self.keys, hash_key(key)) % len(self.keys)
+        return self.owners[idx]
+
+
+class ClusterCoordinator(object):
+
+    def __init__(self, client, db_path, instance_id=None, heartbeat_interval=5, member_ttl=15, vnodes=64):
+        self.client = client
+        self.db_path = db_path
+        self.instance_id = instance_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.heartbeat_interval = heartbeat_interval
+        self.member_ttl = member_ttl
+        self.vnodes = vnodes
+        self.ring = HashRing([self.instance_id], vnodes)
+        self.leader = False
+        self.lease_expires = 0.0
+        self.last_heartbeat = 0.0
+        self.stop_event = threading.Event()
+        self._init_db()
+
+    @classmethod
+    def from_config(cls, client):
+        if config.get('enabled') is not True:
+            return None
+        return cls(
+            client,
+            config.get('db_path') or os.path.join(os.getcwd(), 'cluster.sqlite3'),
+            instance_id=config.get('instance_id'),
+            heartbeat_interval=config.get('heartbeat_interval') or 5,
+            member_ttl=config.get('member_ttl') or 15,
+            vnodes=config.get('vnodes') or 64
+        )
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        try:
+            for statement in SCHEMA:
+                conn.execute(statement)
+        finally:
+            conn.close()
+
+    def start(self):
+        self.stop_event.clear()
+        self.heartbeat()
+        threading.Thread(target=self._run_heartbeat, daemon=True).start()
+        logger.info(f"Joined cluster as {self.instance_id} (leader: {self.leader})")
+
+    def stop(self):
+        self.stop_event.set()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM members WHERE instance_id = ?", (self.instance_id,))
+            conn.execute("DELETE FROM leader WHERE instance_id = ?", (self.instance_id,))
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        self.leader = False
+
+    def _run_heartbeat(self):
+        while not self.stop_event.wait(self.heartbeat_interval):
+            try:
+                self.heartbeat()
+            except Exception as err:
+                logger.error("Cluster heartbeat failed", err, sys.exc_info())
+
+    def heartbeat(self):
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT OR REPLACE INTO members (instance_id, heartbeat) VALUES (?, ?)",
+                (self.instance_id, now)
+            )
+            conn.execute("DELETE FROM members WHERE heartbeat < ?", (now - self.member_ttl,))
+            # Take or renew the leader lease, it lapses if the holder stops heartbeating
+            conn.execute(
+                "INSERT OR IGNORE INTO leader (id, instance_id, expires) VALUES (1, ?, ?)",
+                (self.instance_id, now + self.member_ttl)
+            )
+            conn.execute(
+                "UPDATE leader SET instance_id = ?, expires = ? WHERE id = 1 AND (instance_id = ? OR expires < ?)",
+                (self.instance_id, now + self.member_ttl, self.instance_id, now)
+            )
+            leader = conn.execute("SELECT instance_id FROM leader WHERE id = 1").fetchone()[0]
+            members = [x[0] for x in conn.execute("SELECT instance_id FROM members")]
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        self.last_heartbeat = now
+        is_leader = leader == self.instance_id
+        if is_leader:
+            self.lease_expires = now + self.member_ttl
+        if is_leader != self.leader:
+            logger.info(f"Cluster leadership changed, leader is now {leader}")
+        self.leader = is_leader
+        if tuple(sorted(members)) != self.ring.members:
+            logger.info(f"Cluster membership changed: {sorted(members)}")
+            self.ring = HashRing(members, self.vnodes)
+        metrics.set('slackbot_cluster_members', len(members))
+        metrics.set('slackbot_cluster_leader', 1 if is_leader else 0)
+
+    def claim_event(self, event_id, ttl):
+        # Shared by every instance on this store, False if another one (or
+        # this one) already took the event within ttl
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM events WHERE expires < ?", (now,))
+            claimed = conn.execute(
+                "INSERT OR IGNORE INTO events (event_id, expires) VALUES (?, ?)",
+                (event_id, now + ttl)
+            ).rowcount == 1
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return claimed
+
+    def owns(self, channel):
+        # Peers drop us from their ring member_ttl after our last heartbeat
+        # and take over our channels, so stop answering them at that point
+        if time.time() - self.last_heartbeat >= self.member_ttl:
+            return False
+        return self.ring.owner(channel) == self.instance_id
+
+    def is_leader(self):
+        # A lease we failed to renew may already belong to someone else
+        return self.leader and time.time() < self.lease_expires
@@ -3,16 +3,27 @@
 import os
 import sys
 import time
+import inspect
 import threading
 import importlib.util
 
-from slack import RTMClient
+from slack import RTMClient, WebClient
 
 from ..logging import SlackBotLogger as logger
 from ..config import SlackBotConfig as config
 from ..db import DatabaseSession
+from ..cache import TTLCache
+from ..metrics import SlackBotMetrics as metrics
+from ..metrics import MetricsServer
+from ..profiling import Profiler, MemoryTracker
+from ..tracing import SlackBotTracer as tracer
+from ..cluster import ClusterCoordinator
+from ..events import EventsReceiver
 from .pluginmanager import PluginManager
 from .context import ContextManager
+from .ingress import IngressQueue
+from .workers import Zygote
+from .uploads import open_upload
 from .exceptions import ConfigParsingError, InvalidCredentials, InvalidPlugin, \
         InvalidResponseFromPlugin, MissingBotName, MissingSlackToken
 
@@ -21,11 +32,30 @@ class SlackBot(object):
 
     def __init__(self):
         logger.info("Starting up Slack Bot", format_opts=["header"])
+        if config.get('worker_plugins'):
+            # Has to be forked before any of our threads exist
+            Zygote.start()
         basedir = os.path.dirname(os.path.realpath(__file__))
         self.base_path = os.path.join(basedir, '..', '..')
         self.ready_event = threading.Event()
         self.stop_event = threading.Event()
+        self.reload_lock = threading.Lock()
+        dedup = config.get('dedup') or {}
+        self.seen_messages = TTLCache(
+            maxsize=dedup.get('size') or 10000,
+            ttl=dedup.get('ttl') or 600
+        )
+        self.rtm_client = None
+        self.events_receiver = None
+        self.profiler = Profiler(self)
+        self.memory = MemoryTracker(self)
+        metrics.register_collector(self._collect_metrics)
+        self.cluster = ClusterCoordinator.from_config(self)
+        if self.cluster:
+            self.cluster.start()
         self.__bootstrap()
+        MetricsServer.start()
+        tracer.start()
 
     def __bootstrap(self):
         logger.info("Loading configuration...")
@@ -36,6 +66,9 @@ class SlackBot(object):
         self.contexts = ContextManager(self)
         logger.info("Loading Plugins...")
         self.plugins = PluginManager(self, os.path.join(self.base_path, 'plugins'))
+        self.ingress = IngressQueue.from_config(self)
+        if self.ingress:
+            self.ingress.start()
 
     def __verify_config(self):
         self.name = config.get('bot_name')
@@ -48,9 +81,11 @@ class SlackBot(object):
         logger.debug("Retieved slack token from configuration")
         self.admins = config.get('admins') or []
         logger.debug(f"Configured admins: {self.admins}")
+        self.max_message_length = config.get('max_message_length') or 4000
 
     def _get_users(self):
-        api_call = self.client.api_call("users.list")
+        with metrics.timer('slackbot_slack_api_seconds', method='users.list'):
+            api_call = self.client.api_call("users.list")
         if api_call.get('ok'):
             return api_call.get('members')
 
@@ -62,12 +97,36 @@ class SlackBot(object):
     def _wait(self, interval):
         self.stop_event.wait(interval)
 
+    def _collect_metrics(self, registry):
+        counts = {}
+        for ctx in self.contexts.snapshot():
+            counts[ctx.plugin] = counts.get(ctx.plugin, 0) + 1
+        for plugin, count in counts.items():
+            registry.set('slackbot_active_contexts', count, plugin=plugin)
+        for key in registry.get_values('slackbot_active_contexts'):
+            if dict(key).get('plugin') not in counts:
+                registry.set('slackbot_active_contexts', 0, **dict(key))
+        if self.ingress:
+            for lane, depth in self.ingress.depths().items():
+                registry.set('slackbot_ingress_depth', depth, lane=lane)
+        registry.set('slackbot_dedup_entries', len(self.seen_messages))
+        if self.plugins.rate_limiter:
+            registry.set('slackbot_rate_limit_keys', self.plugins.rate_limiter.size())
+
+    def _send_text(self, channel, text):
+        # Slack truncates long messages, send them as a snippet instead
+        if len(text) > self.max_message_length:
+            metrics.inc('slackbot_oversized_responses_total')
+            self.send_channel_file(channel, 'response.txt', 'text', content=text)
+        else:
+            self.send_channel_message(channel, text)
+
     def _handle_plugin_response(self, channel, response):
         if isinstance(response, str):
-            self.send_channel_message(channel, response)
+            self._send_text(channel, response)
         elif isinstance(response, list):
             for item in response:
-                self.send_channel_message(channel, item)
+                self._send_text(channel, item)
         else:
             logger.info(f"Invalid response from plugin: {response}")
 
@@ -83,17 +142,81 @@ class SlackBot(object):
     def is_mention(self, text):
         return self.at_bot in text
 
+    def is_admin(self, user_id):
+        if user_id in self.admins:
+            return True
+        user = self.get_user_profile(user_id) if user_id else None
+        return bool(user) and user.get('name') in self.admins
+
     def shutdown(self):
         logger.info("Received shutdown signal...")
         self.stop_event.set()
-        self.rtm_client.stop()
+        self.plugins.loop_stop.set()
+        if self.cluster:
+            self.cluster.stop()
+        if self.events_receiver:
+            self.events_receiver.stop()
+        if self.rtm_client:
+            self.rtm_client.stop()
 
     def restart(self):
         self.shutdown()
         time.sleep(5)
+        if self.cluster:
+            self.cluster.start()
         self.__bootstrap()
         self.start()
 
+    def reload_users(self):
+        users = self._get_users()
+        if not users:
+            return False
+        self.users = users
+        return True
+
+    def reload_config(self):
+        config.load_config()
+        self.admins = config.get('admins') or []
+        self.max_message_length = config.get('max_message_length') or 4000
+        self.plugins.reload_config()
+        return True
+
+    def reload_plugins(self):
+        # Re-imports every enabled plugin and runs a full setUp, the current
+        # plugins keep serving until the new set is ready
+        timeout = config.get('reload_timeout') or 60
+        plugins = PluginManager(self, os.path.join(self.base_path, 'plugins'))
+        if not plugins.wait_ready(timeout):
+            # Stops its loops and workers, plugins still in setUp are torn
+            # down as they finish
+            plugins.teardown()
+            return False
+        old, self.plugins = self.plugins, plugins
+        old.teardown()
+        return True
+
+    def reload(self, target):
+        if not self.reload_lock.acquire(blocking=False):
+            return None
+        try:
+            start = time.perf_counter()
+            try:
+                if target == 'users':
+                    ok = self.reload_users()
+                elif target == 'config':
+                    ok = self.reload_config()
+                else:
+                    ok = self.reload_plugins()
+            except Exception as err:
+                logger.error(f"Failed to reload {target}", err, sys.exc_info())
+                ok = False
+            elapsed = time.perf_counter() - start
+            metrics.observe('slackbot_reload_seconds', elapsed, target=target)
+            logger.info(f"Reloaded {target} in {elapsed * 1000:.1f}ms (ok: {ok})")
+            return ok, elapsed
+        finally:
+            self.reload_lock.release()
+
     def ready(self):
         return self.ready_event.is_set()
 
@@ -102,15 +225,37 @@ class SlackBot(object):
 
     def start(self):
         try:
-            self.rtm_client = RTMClient(token=config.get('slack_token'))
+            opts = {"token": config.get('slack_token')}
+            if config.get('slack_api_url'):
+                opts["base_url"] = config.get('slack_api_url')
+            if config.get('ingress') == 'events':
+                self.start_events(opts)
+                return
+            self.rtm_client = RTMClient(**opts)
             self.rtm_client.start()
         except KeyboardInterrupt:
             self.shutdown()
 
+    def start_events(self, opts):
+        logger.info("Using the Events API for ingress")
+        web_client = WebClient(**opts)
+        self.events_receiver = EventsReceiver.from_config(self, web_client)
+        self.handle_hello({"web_client": web_client})
+        self.events_receiver.run()
+
     def get_help_page(self, command):
         return self.plugins.get_help_page(command)
 
     def handle_hello(self, payload):
+        if self.ready():
+            self._handle_hello(payload)
+            return
+        with self.plugins.startup.measure('hello', 'slack'):
+            self._handle_hello(payload)
+        if self.plugins.ready():
+            self.plugins.startup.log()
+
+    def _handle_hello(self, payload):
         logger.debug("Received 'hello' from slack rtm api")
         logger.debug("Setting slack web/rtm clients")
         self.client = payload.get('web_client')
@@ -123,57 +268,119 @@ class SlackBot(object):
         self.ready_event.set()
         logger.info("Initialization Complete!", format_opts=["green"])
 
+    def _is_duplicate(self, output):
+        # Slack redelivers events after reconnects, client_msg_id is only
+        # set on messages typed by users so fall back to (channel, ts)
+        key = output.get('client_msg_id')
+        if not key and output.get('ts'):
+            key = (output.get('channel'), output.get('ts'))
+        if not key:
+            return False
+        if self.seen_messages.add(key, True):
+            metrics.inc('slackbot_dedup_total', result='miss')
+            return False
+        metrics.inc('slackbot_dedup_total', result='hit')
+        logger.debug(f"Dropping redelivered message {key}")
+        return True
+
     def handle_message(self, payload):
+        if self._is_duplicate(payload.get('data') or {}):
+            return
+        if self.ingress:
+            self.ingress.submit(payload)
+        else:
+            self.process_message(payload)
+
+    def process_message(self, payload, queued=None, command=None):
+        start = time.perf_counter()
+        data = payload.get('data') or {}
+        with tracer.trace('message', channel=data.get('channel'), user=data.get('user')) as span:
+            if span and queued is not None:
+                span.set('ingress_wait', round(queued, 6))
+            if self.profiler.active:
+                path = self.profiler.run('message', self._dispatch_message, payload, command)
+            else:
+                path = self._dispatch_message(payload, command)
+            if span:
+                span.set('path', path)
+        metrics.inc('slackbot_messages_total', path=path)
+        metrics.observe('slackbot_message_seconds', time.perf_counter() - start, path=path)
+
+    def _dispatch_message(self, payload, command=None):
         logger.debug(f"Handling slack message payload: {payload}")
         output = payload.get('data')
         if self._is_not_message(output) or self._is_self_message(output):
-            return
+            return 'ignored'
         channel = output.get('channel')
         if not channel:
-            return
+            return 'ignored'
+        # Events API deliveries are already spread across instances by the
+        # load balancer, only the RTM firehose needs sharding
+        if self.cluster and not self.events_receiver and not self.cluster.owns(channel):
+            return 'foreign'
         try:
             logger.debug("Looking up source user of event")
-            user = self.get_user_profile(output['user'])
+            with tracer.span('user_lookup'):
+                user = self.get_user_profile(output['user'])
             logger.debug(f"User: {user}")
         except Exception as err:
-            log.error(f"Failed to fetch user for event: {output}", err, sys.exc_info())
-            return
+            logger.error(f"Failed to fetch user for event: {output}", err, sys.exc_info())
+            return 'error'
         text = output['text']
+        path = 'none'
         try:
             logger.info(f"<{channel}/{user['profile']['display_name']}>: {text}")
-            cmd, words = self.plugins.get_cmd(text)
+            if command is None:
+                with tracer.span('command_lookup'):
+                    command = self.plugins.get_cmd(text)
+            cmd, words = command
             if cmd:
+                path = 'cmd'
                 res = self.plugins.serve_cmd(channel, user, cmd, words)
                 if res:
                     self._handle_plugin_response(channel, res)
-                return
+                return path
             words = text.split()
-            ctx = self.contexts.get_context(channel, user['id'])
+            with tracer.span('context_lookup'):
+                ctx = self.contexts.get_context(channel, user['id'])
             if ctx:
                 if ctx.is_finished() or ctx.is_expired():
-                    return
-                with self.contexts.lock:
+                    return 'expired_context'
+                path = 'context'
+                with ctx.lock:
+                    # An earlier message in this conversation may have
+                    # finished it while we waited for the lock
+                    if ctx.is_finished():
+                        return 'expired_context'
                     res = self.plugins.serve_context(channel, user, ctx, words)
                     if res:
                         self._handle_plugin_response(channel, res)
                     ctx.messages.append(words)
-                    return
-            trigger = self.plugins.get_trigger(text)
+                # Finishing the context without a reply hands the message
+                # back, e.g. someone asking something new part way through
+                if res or not ctx.is_finished():
+                    return path
+            with tracer.span('trigger_scan'):
+                trigger = self.plugins.get_trigger(text)
             if trigger:
+                path = 'trigger'
                 res = self.plugins.serve_trigger(channel, user, trigger, words)
                 if res:
                     self._handle_plugin_response(channel, res)
-                return
+                return path
             if self.is_mention(text):
-                text.replace(self.at_bot, "")
+                path = 'mention'
+                text = text.replace(self.at_bot, "")
                 res = self.plugins.serve_mention(channel, user, text.split())
                 if res:
                     self._handle_plugin_response(channel, res)
-                    return
+                    return path
             logger.debug("No plugins matched the event")
+            return path
         except Exception as err:
             logger.error("Failed processing message", err, sys.exc_info())
             self._handle_plugin_response(channel, "An error has occurred and been logged accordingly")
+            return path
 
     def sanitize_handle(self, handle):
         fixed = handle
@@ -203,62 +410,119 @@ class SlackBot(object):
             """
         )
         if not action:
-            response = self.client.chat_postMessage(
-                channel=channel,
-                text=message,
-                attachments=attachments,
-                as_user=True
-            )
+            with metrics.timer('slackbot_slack_api_seconds', method='chat.postMessage'), \
+                    tracer.span('slack_api', method='chat.postMessage'):
+                response = self.client.chat_postMessage(
+                    channel=channel,
+                    text=message,
+                    attachments=attachments,
+                    as_user=True
+                )
         else:
-            response = self.client.chat_meMessage(
-                channel=channel,
-                text=message
-            )
+            with metrics.timer('slackbot_slack_api_seconds', method='chat.meMessage'), \
+                    tracer.span('slack_api', method='chat.meMessage'):
+                response = self.client.chat_meMessage(
+                    channel=channel,
+                    text=message
+                )
         if not response.get('ok'):
+            metrics.inc('slackbot_slack_api_errors_total', method='chat.postMessage' if not action else 'chat.meMessage')
             logger.info(str(response))
 
-    def send_channel_file(self, channel, title, filetype, content):
+    def send_channel_file(self, channel, title, filetype, content=None, path=None,
+                          filename=None, compress=False):
         logger.debug(
             f"""Uploading file to channel
             channel: {channel}
             filename: {title}
             filetype: {filetype}
+            compress: {compress}
             """
         )
-        api_call = self.client.files_upload(
-            channels=channel,
-            title=title,
-            filetype=filetype,
-            content=content
-        )
+        if isinstance(content, str) and not compress:
+            with metrics.timer('slackbot_slack_api_seconds', method='files.upload'), \
+                    tracer.span('slack_api', method='files.upload'):
+                api_call = self.client.files_upload(
+                    channels=channel,
+                    title=title,
+                    filetype=filetype,
+                    content=content
+                )
+            metrics.inc('slackbot_upload_bytes_total', len(content))
+        else:
+            api_call = self._stream_file(channel, title, filetype, content, path, filename, compress)
         if api_call.get('ok'):
             return api_call.get('file')
+        metrics.inc('slackbot_slack_api_errors_total', method='files.upload')
 
-    def register_loop(self, function, args=[], interval=10):
+    def _stream_file(self, channel, title, filetype, content, path, filename, compress):
+        # Paths, bytes, file objects and chunk generators are handed to the
+        # client as a file object and read in chunks by the multipart encoder
+        filename = filename or (os.path.basename(path) if path else title)
+        if compress:
+            filename += '.gz'
+            filetype = 'gzip'
+        upload = open_upload(content=content, path=path, compress=compress)
+        try:
+            with metrics.timer('slackbot_slack_api_seconds', method='files.upload'), \
+                    tracer.span('slack_api', method='files.upload'):
+                return self.client.files_upload(
+                    channels=channel,
+                    title=title,
+                    filetype=filetype,
+                    filename=filename,
+                    file=upload
+                )
+        finally:
+            metrics.inc('slackbot_upload_bytes_total', upload.raw.bytes_read)
+            upload.close()
+
+    def register_loop(self, function, args=[], interval=10, leader_only=False):
+        name = f"{inspect.stack()[1][1].split('/')[-2]}.{function.__name__}"
         logger.debug(
             f"""Registering plugin loop
             Function: {function}
+            Name: {name}
             args: {args}
             interval: {interval}
+            leader_only: {leader_only}
             """
         )
         threading.Thread(
             target=self.run_plugin_loop,
-            args=[function, interval, args],
+            args=[function, interval, args, name, leader_only, self._loop_stop()],
             daemon=True
         ).start()
 
-    def run_plugin_loop(self, function, interval, args=[]):
-        self._wait(interval)
-        while self.running():
+    def _loop_stop(self):
+        # Loops registered during setUp belong to the manager running it,
+        # which during a reload is not self.plugins yet
+        manager = getattr(PluginManager.setup_local, 'manager', None) or self.plugins
+        return manager.loop_stop
+
+    def run_plugin_loop(self, function, interval, args=[], name=None, leader_only=False, stop=None):
+        name = name or function.__name__
+        stop = stop or self.stop_event
+        due = time.monotonic() + interval
+        stop.wait(interval)
+        while self.running() and not stop.is_set():
+            if leader_only and self.cluster and not self.cluster.is_leader():
+                logger.debug(f"Skipping {name}, this instance is not the cluster leader")
+                due = time.monotonic() + interval
+                stop.wait(interval)
+                continue
+            metrics.observe('slackbot_loop_lag_seconds', max(0.0, time.monotonic() - due), loop=name)
+            start = time.perf_counter()
             try:
-                if len(args) > 0:
-                    logger.debug(f"Firing {function} with args: {args}")
-                    function(*args)
+                logger.debug(f"Firing {function} with args: {args}")
+                if self.profiler.active:
+                    self.profiler.run('loop', function, *args)
                 else:
-                    logger.debug(f"Firing {function}")
-                    function()
-                self._wait(interval)
+                    function(*args)
             except Exception as err:
+                metrics.inc('slackbot_loop_errors_total', loop=name)
                 logger.error("Exception while running plugin loop", err, sys.exc_info())
-                self._wait(interval)
+            metrics.observe('slackbot_loop_seconds', time.perf_counter() - start, loop=name)
+            due = time.monotonic() + interval
+            stop.wait(interval)
+        logger.debug(f"Stopped plugin loop {name}")
@@ -14,17 +14,19 @@ def get_caller():
 
 class Context(object):
 
-    def __init__(self, plugin, channel, user_id, timeout=60, messages=[], timeout_message=None, timeout_use_action=False):
+    def __init__(self, plugin, channel, user_id, timeout=60, messages=None, timeout_message=None, timeout_use_action=False):
         self.plugin = plugin
         self.channel = channel
         self.user_id = user_id
         self.start = datetime.now()
         self.end = self.start + timedelta(seconds=timeout)
-        self.messages = messages
+        self.messages = messages if messages is not None else []
         self.timeout_message = timeout_message
         self.timeout_use_action = timeout_use_action
         self.finished = threading.Event()
         self.values = {}
+        # Serializes messages within this conversation only
+        self.lock = threading.Lock()
 
     def _cleanup(self, client):
         if self.timeout_message:
@@ -55,12 +57,19 @@ class Context(object):
         self.timeout_message = msg
         self.timeout_use_action = action
 
+    def extend(self, timeout):
+        self.end = datetime.now() + timedelta(seconds=timeout)
+
     def finish(self):
         self.finished.set()
 
 
 class ContextManager(object):
 
+    # The index is copy-on-write: the lock is only held to swap in a new
+    # dict on structural changes, readers and the gc work on whatever dict
+    # was current when they looked. Plugin calls lock the Context itself
+
     def __init__(self, client):
         self.client = client
         self.contexts = {}
@@ -71,13 +80,16 @@ class ContextManager(object):
         ).start()
 
     def _chan_ctx_for_user(self, channel, user_id):
-        if not self.contexts.get(user_id):
-            return None
-        for x in self.contexts[user_id]:
-            if channel == x.channel:
+        # Finished contexts linger until the gc runs, they must not swallow
+        # the user's next message
+        for x in self.contexts.get(user_id) or []:
+            if channel == x.channel and not x.is_finished():
                 return x
         return None
 
+    def snapshot(self):
+        return [ctx for ctxs in self.contexts.values() for ctx in ctxs]
+
     def _run_context_gc(self):
         while not self.client.ready():
             self.client._wait(3)
@@ -85,44 +97,49 @@ class ContextManager(object):
         while self.client.running():
             expired = []
             finished = []
-            for user, ctxs in self.contexts.items():
-                for ctx in ctxs:
-                    if ctx.is_finished():
-                        finished.append(ctx)
-                    elif ctx.is_expired():
-                        expired.append(ctx)
+            for ctx in self.snapshot():
+                if ctx.is_finished():
+                    finished.append(ctx)
+                elif ctx.is_expired():
+                    expired.append(ctx)
             for ctx in expired:
                 logger.debug(f"Context has expired: {vars(ctx)}")
                 ctx._cleanup(self.client)
                 self.finish_context(ctx)
+                # Expired contexts are never served again, drop whatever
+                # the plugin kept on them even if something still holds ctx
+                ctx.values = {}
             for ctx in finished:
                 logger.debug(f"Context is finished: {vars(ctx)}")
                 self.finish_context(ctx)
             self.client._wait(5)
 
-    def new_context(self, channel, user_id, timeout=60, messages=[], timeout_message=None, timeout_use_action=False):
+    def new_context(self, channel, user_id, timeout=60, messages=None, timeout_message=None, timeout_use_action=False, plugin=None):
+        ctx = Context(
+            plugin or get_caller(),
+            channel,
+            user_id,
+            timeout=timeout,
+            messages=messages,
+            timeout_message= timeout_message,
+            timeout_use_action=timeout_use_action
+        )
         with self.lock:
-            if not self.contexts.get(user_id):
-                self.contexts[user_id] = []
-            ctx = Context(
-                get_caller(),
-                channel,
-                user_id,
-                timeout=timeout,
-                messages=messages,
-                timeout_message= timeout_message,
-                timeout_use_action=timeout_use_action
-            )
-            self.contexts[user_id].append(ctx)
-            return ctx
+            contexts = dict(self.contexts)
+            contexts[user_id] = contexts.get(user_id, []) + [ctx]
+            self.contexts = contexts
+        return ctx
 
     def get_context(self, channel, user_id):
         return self._chan_ctx_for_user(channel, user_id)
 
     def finish_context(self, ctx):
+        ctx.finish()
         with self.lock:
-            new_ctxs = [x for x in self.contexts[ctx.user_id] if x.channel != ctx.channel]
+            contexts = dict(self.contexts)
+            new_ctxs = [x for x in contexts.get(ctx.user_id, []) if x is not ctx]
             if len(new_ctxs) == 0:
-                del self.contexts[ctx.user_id]
+                contexts.pop(ctx.user_id, None)
             else:
-                self.contexts[ctx.user_id] = new_ctxs
+                contexts[ctx.user_id] = new_ctxs
+            self.contexts = contexts
@@ -23,3 +23,11 @@ class MissingBotName(Exception):
 
 class MissingSlackToken(Exception):
     pass
+
+
+class MissingSigningSecret(Exception):
+    pass
+
+
+class PluginWorkerError(Exception):
+    pass
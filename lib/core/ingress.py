@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+import sys
+import time
+import threading
+from collections import deque
+
+from ..config import SlackBotConfig as config
+from ..logging import SlackBotLogger as logger
+from ..metrics import SlackBotMetrics as metrics
+
+
+# Highest priority first
+LANES = ['admin', 'command', 'context', 'trigger']
+ADMIN_COMMANDS = ['shutdown', 'restart', 'reload', 'profile', 'memory']
+POLICIES = ['shed_newest', 'shed_oldest', 'defer']
+
+DEFAULT_LANES = {
+    'admin': {'size': 50, 'policy': 'shed_oldest'},
+    'command': {'size': 200, 'policy': 'defer'},
+    'context': {'size': 200, 'policy': 'defer'},
+    'trigger': {'size': 100, 'policy': 'shed_oldest'},
+}
+
+
+class IngressQueue(object):
+
+    def __init__(self, client, workers=4, max_size=500, lanes=None, defer_size=200, max_age=30):
+        self.client = client
+        self.workers = workers
+        self.max_size = max_size
+        self.lane_opts = {}
+        for lane in LANES:
+            opts = dict(DEFAULT_LANES[lane])
+            opts.update((lanes or {}).get(lane) or {})
+            if opts['policy'] not in POLICIES:
+                raise ValueError(f"Unknown ingress policy for {lane}: {opts['policy']}")
+            self.lane_opts[lane] = opts
+        self.lanes = {lane: deque() for lane in LANES}
+        self.deferred = deque()
+        self.defer_size = defer_size
+        self.max_age = max_age
+        self.size = 0
+        # Conversations with a message being served, their next one waits
+        self.active = set()
+        self.cond = threading.Condition()
+
+    @classmethod
+    def from_config(cls, client):
+        opts = config.get('ingress_queue')
+        if not opts or opts.get('enabled') is not True:
+            return None
+        return cls(
+            client,
+            workers=opts.get('workers') or 4,
+            max_size=opts.get('max_size') or 500,
+            lanes=opts.get('lanes'),
+            defer_size=opts.get('defer_size') or 200,
+            max_age=opts.get('max_age') or 30
+        )
+
+    def start(self):
+        for idx in range(self.workers):
+            threading.Thread(target=self._run_worker, daemon=True).start()
+        logger.debug(f"Started {self.workers} ingress workers")
+
+    def classify(self, payload):
+        # Returns the lane and the command lookup, which is handed to the
+        # dispatch so it isn't done twice
+        output = payload.get('data') or {}
+        text = output.get('text') or ''
+        if not text.strip():
+            return 'trigger', (None, None)
+        command = self.client.plugins.get_cmd(text)
+        cmd = command[0]
+        if cmd:
+            if cmd in ADMIN_COMMANDS and self.client.is_admin(output.get('user')):
+                return 'admin', command
+            return 'command', command
+        if self.client.contexts.get_context(output.get('channel'), output.get('user')):
+            return 'context', command
+        return 'trigger', command
+
+    def _shed(self, lane, reason):
+        metrics.inc('slackbot_ingress_shed_total', lane=lane, reason=reason)
+        logger.debug(f"Shedding {lane} message: {reason}")
+
+    def _evict_lower(self, lane):
+        # Make room by dropping the oldest message of a lower priority lane
+        for victim in reversed(LANES[LANES.index(lane) + 1:]):
+            if self.lanes[victim]:
+                self.lanes[victim].popleft()
+                self.size -= 1
+                self._shed(victim, 'preempted')
+                return True
+        return False
+
+    def _defer(self, lane, item):
+        if len(self.deferred) >= self.defer_size:
+            self._shed(lane, 'defer_full')
+            return False
+        self.deferred.append((lane,) + item)
+        metrics.inc('slackbot_ingress_deferred_total', lane=lane)
+        self.cond.notify()
+        return True
+
+    def submit(self, payload):
+        lane, command = self.classify(payload)
+        key = None
+        if lane == 'context':
+            data = payload.get('data') or {}
+            key = (data.get('channel'), data.get('user'))
+        item = (time.monotonic(), payload, command, key)
+        with self.cond:
+            if key is not None and any(x[-1] == key for x in self.deferred):
+                # Behind the deferred messages of its own conversation
+                return self._defer(lane, item)
+            queue = self.lanes[lane]
+            policy = self.lane_opts[lane]['policy']
+            lane_full = len(queue) >= self.lane_opts[lane]['size']
+            total_full = False
+            # Only preempt other lanes when this lane itself has room, a full
+            # lane is handled by its own policy below
+            if not lane_full and self.size >= self.max_size:
+                total_full = not self._evict_lower(lane)
+            if lane_full or total_full:
+                if policy == 'defer':
+                    return self._defer(lane, item)
+                if policy == 'shed_newest' or not queue:
+                    self._shed(lane, 'full')
+                    return False
+                queue.popleft()
+                self.size -= 1
+                self._shed(lane, 'full')
+            queue.append(item)
+            self.size += 1
+            self.cond.notify()
+        return True
+
+    def _take(self, queue):
+        # Skips messages whose conversation is being served by another
+        # worker, so replies in a conversation keep their order
+        for idx, item in enumerate(queue):
+            key = item[-1]
+            if key is None or key not in self.active:
+                del queue[idx]
+                if key is not None:
+                    self.active.add(key)
+                return item
+        return None
+
+    def _next(self):
+        for lane in LANES:
+            item = self._take(self.lanes[lane])
+            if item is not None:
+                self.size -= 1
+                return (lane,) + item
+        return self._take(self.deferred)
+
+    def _run_worker(self):
+        while self.client.running():
+            with self.cond:
+                item = self._next()
+                while item is None:
+                    self.cond.wait(1)
+                    if not self.client.running():
+                        return
+                    item = self._next()
+            lane, queued, payload, command, key = item
+            try:
+                wait = time.monotonic() - queued
+                if wait > self.max_age:
+                    self._shed(lane, 'expired')
+                    continue
+                metrics.observe('slackbot_ingress_wait_seconds', wait, lane=lane)
+                self.client.process_message(payload, wait, command)
+            except Exception as err:
+                logger.error("Ingress worker failed to process message", err, sys.exc_info())
+            finally:
+                if key is not None:
+                    with self.cond:
+                        self.active.discard(key)
+                        self.cond.notify_all()
+
+    def depths(self):
+        with self.cond:
+            out = {lane: len(queue) for lane, queue in self.lanes.items()}
+            out['deferred'] = len(self.deferred)
+            return out
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+import re
+import random
+
+from ..corpus import normalize
+from ..config import SlackBotConfig as config
+from ..metrics import SlackBotMetrics as metrics
+from ..tracing import SlackBotTracer as tracer
+
+
+DEFAULT_CHAIN = ['intents', 'canned', 'chatterbot']
+
+# Whole utterances only, "hey, how do I ..." is a question for the
+# stages after this one
+DEFAULT_INTENTS = [
+    {'match': r'^(hi|hello|hey|howdy|yo)\W*$', 'reply': ["Hello there!", "Hi!", "Hey!"]},
+    {'match': r'^(thanks|thank you|thx|ty|cheers)\W*$', 'reply': ["You're welcome!", "Any time!"]},
+    {'match': r'^(help|what can you do)\W*$', 'command': 'list'},
+]
+
+DEFAULT_CANNED = {
+    'good bot': ":robot_face: :heart:",
+    'bad bot': ":cry:",
+    'ping': "pong",
+}
+
+
+class IntentStage(object):
+    # Intents either reply directly or hand off to a registered command,
+    # e.g. "help" runs the list builtin
+
+    name = 'intents'
+
+    def __init__(self, intents):
+        self.intents = []
+        for intent in intents:
+            if not intent.get('reply') and not intent.get('command'):
+                raise ValueError(f"Mention intent {intent.get('match')} needs a reply or a command")
+            self.intents.append((re.compile(intent['match'], re.I), intent))
+
+    def __call__(self, plugins, channel, user, text):
+        for regex, intent in self.intents:
+            if regex.search(text):
+                if intent.get('command'):
+                    return plugins.serve_cmd(channel, user, intent['command'], intent.get('args') or [])
+                return _pick(intent['reply'])
+        return None
+
+
+class CannedStage(object):
+
+    name = 'canned'
+
+    def __init__(self, replies):
+        self.replies = {normalize(k): v for k, v in replies.items()}
+
+    def __call__(self, plugins, channel, user, text):
+        reply = self.replies.get(normalize(text))
+        return _pick(reply) if reply else None
+
+
+class PluginStage(object):
+    # Any other name in the chain is a plugin whose on_recv gets the mention
+
+    def __init__(self, name):
+        self.name = name
+
+    def __call__(self, plugins, channel, user, text):
+        plugin = plugins.hook_manager.get_hook_by_name(self.name)
+        if not plugin:
+            return None
+        return plugins._serve_limited('mention', plugin, plugin._on_recv, channel, user, "", text.split())
+
+
+def _pick(reply):
+    if isinstance(reply, list):
+        return random.choice(reply)
+    return reply
+
+
+class MentionChain(object):
+    # Mentions that matched nothing else walk the stages in order and stop
+    # at the first reply, so the model only sees what the cheap ones missed
+
+    def __init__(self, stages):
+        self.stages = stages
+
+    @classmethod
+    def from_config(cls):
+        opts = config.get('mentions') or {}
+        intents = opts.get('intents')
+        canned = opts.get('canned')
+        stages = []
+        for name in opts.get('chain') or DEFAULT_CHAIN:
+            if name == 'intents':
+                stages.append(IntentStage(DEFAULT_INTENTS if intents is None else intents))
+            elif name == 'canned':
+                stages.append(CannedStage(DEFAULT_CANNED if canned is None else canned))
+            else:
+                stages.append(PluginStage(name))
+        return cls(stages)
+
+    def serve(self, plugins, channel, user, text):
+        for stage in self.stages:
+            with metrics.timer('slackbot_mention_stage_seconds', stage=stage.name), \
+                    tracer.span('mention_stage', stage=stage.name):
+                res = stage(plugins, channel, user, text)
+            if res:
+                metrics.inc('slackbot_mention_stage_total', stage=stage.name, result='hit')
+                return res
+            metrics.inc('slackbot_mention_stage_total', stage=stage.name, result='miss')
+        return None
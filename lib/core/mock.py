@@ -2,6 +2,8 @@
 
 import sys
 import time
+import threading
+from collections import deque
 
 from .bot import SlackBot
 from ..logging import SlackBotLogger as logger
@@ -32,30 +34,53 @@ class MockClient(object):
         return method
 
 
+class RecordingClient(object):
+
+    def __init__(self, maxlen=10000):
+        self.calls = deque(maxlen=maxlen)
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        def method(*args, **kwargs):
+            with self.lock:
+                self.calls.append((time.perf_counter(), name, kwargs))
+                self.counts[name] = self.counts.get(name, 0) + 1
+            return {'ok': True, 'file': 'fake_file'}
+        return method
+
+    def reset(self):
+        with self.lock:
+            self.calls.clear()
+            self.counts = {}
+
+
+def mock_user(user_id):
+    return {
+        "id": user_id,
+        "name": user_id,
+        "real_name": user_id,
+        "profile": {"display_name": user_id}
+    }
+
+
 class MockBot(SlackBot):
 
-    def start(self):
+    def setup_mock(self, client=None, users=None):
         logger.debug("Setting up mock api client")
-        self.client = MockClient()
+        self.client = client or MockClient()
         logger.debug("Populating mock users")
-        self.users = [
-            {
-                "id": "console",
-                "name": "console",
-                "real_name": "console",
-                "profile": {"display_name": "console"}
-            },
-            {
-                "id": "mockbot",
-                "name": "mockbot",
-                "real_name": "mockbot",
-                "profile": {"display_name": "mockbot"}
-            }
-        ]
+        self.users = [mock_user(x) for x in (users or ["console"])]
+        self.users.append(mock_user("mockbot"))
         logger.debug("Setting self attributes")
         self.bot_id = "mockbot"
         self.at_bot = "<@" + self.bot_id + ">"
         self.ready_event.set()
+
+    def start(self):
+        self.setup_mock()
         logger.info(
             "Mockbot Initialization Complete! Launching console.",
             format_opts=["green"]
@@ -63,7 +88,7 @@ class MockBot(SlackBot):
         time.sleep(3)
         self.console()
 
-    def register_loop(self, function, args=[], interval=10):
+    def register_loop(self, function, args=[], interval=10, leader_only=False):
         logger.info(
             f"""Would have registered loop, but running in mock mode:
             Function: {function}
@@ -2,39 +2,62 @@
 
 import os
 import re
+import sys
+import time
+import threading
 import importlib.util
 
 from ..builtins import BUILTIN_PLUGINS
 from ..logging import SlackBotLogger as logger
 from ..config import SlackBotConfig as config
+from ..metrics import SlackBotMetrics as metrics
+from ..tracing import SlackBotTracer as tracer
+from .startup import StartupReport
+from .ratelimit import RateLimiter
+from .mentions import MentionChain
+from .workers import PluginWorker
 
 
 class HookManager(object):
 
+    # Plugins register from their setUp threads while messages are being
+    # served, so registrations swap in new dicts instead of mutating the
+    # ones readers may be iterating
+
     def __init__(self):
+        self.lock = threading.Lock()
         self.registered_plugins = {}
         self.registered_hooks = {}
         self.registered_triggers = {}
 
     def register_hook(self, plugin_name, hook):
-        if self.registered_hooks.get(plugin_name):
-            self.registered_hooks[plugin_name].append(hook)
-        else:
-            self.registered_hooks[plugin_name] = [hook]
+        with self.lock:
+            hooks = dict(self.registered_hooks)
+            hooks[plugin_name] = hooks.get(plugin_name, []) + [hook]
+            self.registered_hooks = hooks
 
     def register_trigger(self, plugin_name, trigger):
         regex = re.compile(trigger, re.I)
-        if self.registered_triggers.get(plugin_name):
-            self.registered_triggers[plugin_name].append(regex)
-        else:
-            self.registered_triggers[plugin_name] = [regex]
+        with self.lock:
+            triggers = dict(self.registered_triggers)
+            triggers[plugin_name] = triggers.get(plugin_name, []) + [regex]
+            self.registered_triggers = triggers
 
     def register_plugin(self, name, plugin):
-        self.registered_plugins[name] = plugin
+        with self.lock:
+            plugins = dict(self.registered_plugins)
+            plugins[name] = plugin
+            self.registered_plugins = plugins
 
     def get_hook_by_name(self, name):
         return self.registered_plugins.get(name)
 
+    def get_plugin_name(self, plugin):
+        for k, v in self.registered_plugins.items():
+            if v is plugin:
+                return k
+        return None
+
     def get_cmd_hook(self, cmd):
         for k, v in self.registered_hooks.items():
             if cmd in v:
@@ -64,17 +87,127 @@ class HookManager(object):
 
 class PluginManager(object):
 
+    # Lets register_loop find the manager whose setUp is running
+    setup_local = threading.local()
+
     def __init__(self, client, plugin_dir):
+        self.client = client
         self.hook_manager = HookManager()
         self.trigger_plugins = {}
         self.trigger_phrases = []
         self.help_pages = []
+        self.lock = threading.Lock()
+        self.pending_hooks = {}
+        self.setup_events = {}
+        self.ready_event = threading.Event()
+        # Loops registered by this set of plugins stop when it is torn down
+        self.loop_stop = threading.Event()
+        self.torn_down = False
+        self.startup = StartupReport(trace_memory=config.get('startup_trace_memory') is True)
+        self.rate_limiter = RateLimiter.from_config()
+        self.mention_chain = MentionChain.from_config()
+        # Checked for every message, config.get walks the stack
+        self.command_trigger = config.get('command_trigger')
+        # Workers import their plugin again from here in the zygote
+        self.plugin_files = {}
         self._load_builtin_plugins(client)
         plugins = self._scrape_plugins(plugin_dir)
+        self._setup_plugins(client, plugins)
+
+    def _setup_plugins(self, client, plugins):
         for name, plugin in plugins.items():
-            loaded = plugin(client=client)
-            loaded._setUp()
-            self._register_plugin(name, loaded)
+            self.setup_events[name] = threading.Event()
+            if isinstance(getattr(plugin, 'hooks', None), list):
+                for hook in plugin.hooks:
+                    self.pending_hooks[hook] = name
+        workers = {}
+        for name in config.get('worker_plugins') or []:
+            if name in plugins:
+                # Forked one at a time from here, before any setUp thread
+                # is running, each waits for its setUp call below
+                workers[name] = PluginWorker(
+                    client,
+                    name,
+                    plugins[name],
+                    path=self.plugin_files.get(name),
+                    timeout=config.get('worker_timeout') or 120,
+                    threads=config.get('worker_threads') or 4
+                )
+                try:
+                    workers[name].start()
+                except Exception as err:
+                    # _setUp retries it with backoff
+                    logger.error(f"Failed to fork worker for {name}", err, sys.exc_info())
+        for name, plugin in plugins.items():
+            threading.Thread(
+                target=self._setup_plugin,
+                args=[client, name, workers.get(name) or plugin],
+                daemon=True
+            ).start()
+        if not plugins:
+            self._finish_setup()
+
+    def _setup_plugin(self, client, name, plugin):
+        PluginManager.setup_local.manager = self
+        try:
+            for dependency in getattr(plugin, 'depends_on', []):
+                if dependency in self.setup_events:
+                    self.setup_events[dependency].wait()
+            with self.startup.measure('setUp', name):
+                loaded = plugin if isinstance(plugin, PluginWorker) else plugin(client=client)
+                loaded._setUp()
+            with self.lock:
+                torn_down = self.torn_down
+                if not torn_down:
+                    self._register_plugin(name, loaded)
+            if torn_down:
+                # Finished after a timed out reload gave up on this manager
+                self._teardown_plugin(name, loaded)
+        except Exception as err:
+            logger.error(f"Failed to set up plugin {name}", err, sys.exc_info())
+        finally:
+            PluginManager.setup_local.manager = None
+            with self.lock:
+                self.pending_hooks = {k: v for k, v in self.pending_hooks.items() if v != name}
+                self.setup_events[name].set()
+            if all(x.is_set() for x in self.setup_events.values()):
+                self._finish_setup()
+
+    def _finish_setup(self):
+        with self.lock:
+            if self.ready_event.is_set():
+                return
+            self.startup.stop_tracing()
+            self.ready_event.set()
+        logger.info("All plugins are set up", format_opts=["green"])
+        if self.startup.has('hello'):
+            self.startup.log()
+
+    def ready(self):
+        return self.ready_event.is_set()
+
+    def reload_config(self):
+        self.rate_limiter = RateLimiter.from_config()
+        self.mention_chain = MentionChain.from_config()
+        self.command_trigger = config.get('command_trigger')
+
+    def teardown(self):
+        with self.lock:
+            self.torn_down = True
+            plugins = list(self.hook_manager.registered_plugins.items())
+        self.loop_stop.set()
+        for name, plugin in plugins:
+            self._teardown_plugin(name, plugin)
+
+    def _teardown_plugin(self, name, plugin):
+        if hasattr(plugin, 'tearDown'):
+            try:
+                plugin.tearDown()
+            except Exception as err:
+                logger.error(f"Failed to tear down plugin {name}", err, sys.exc_info())
+
+    def wait_ready(self, timeout=None):
+        return self.ready_event.wait(timeout)
 
     def _load_builtin_plugins(self, client):
         for key, plugin in BUILTIN_PLUGINS.items():
@@ -92,12 +225,14 @@ class PluginManager(object):
                     files = os.listdir(path)
                     for pfile in files:
                         if str(pfile) == 'plugin.py':
+                            self.plugin_files[plugin] = os.path.join(root_plugin_path, path, pfile)
                             spec = importlib.util.spec_from_file_location(
                                 "module.name",
-                                os.path.join(root_plugin_path, path, pfile)
+                                self.plugin_files[plugin]
                                 )
-                            module = importlib.util.module_from_spec(spec)
-                            spec.loader.exec_module(module)
+                            with self.startup.measure('import', plugin):
+                                module = importlib.util.module_from_spec(spec)
+                                spec.loader.exec_module(module)
                             plugins[plugin] = module.SlackBotPlugin
                             loaded_plugin = True
             if not loaded_plugin:
@@ -118,6 +253,51 @@ class PluginManager(object):
                 self.hook_manager.register_trigger(name, item)
         logger.info(f"Registered plugin: {name}", format_opts=["green"])
 
+    def _serve(self, path, plugin, func, *args):
+        name = self.hook_manager.get_plugin_name(plugin)
+        start = time.perf_counter()
+        try:
+            with tracer.span(f"serve_{path}", plugin=name):
+                return func(*args)
+        except Exception:
+            metrics.inc('slackbot_plugin_errors_total', plugin=name, path=path)
+            raise
+        finally:
+            metrics.inc('slackbot_plugin_calls_total', plugin=name, path=path)
+            metrics.observe('slackbot_plugin_seconds', time.perf_counter() - start, plugin=name, path=path)
+
+    def _serve_limited(self, path, plugin, func, channel, user, *args):
+        limiter = self.rate_limiter
+        if not limiter or (limiter.exempt_admins and self.client.is_admin(user['id'])):
+            return self._serve(path, plugin, func, channel, user, *args)
+        name = self.hook_manager.get_plugin_name(plugin)
+        allowed, delay = limiter.acquire(name, channel, user['id'])
+        if not allowed:
+            metrics.inc('slackbot_rate_limited_total', plugin=name, result='rejected')
+            return limiter.rejection(name, user['id'], delay)
+        if delay:
+            metrics.inc('slackbot_rate_limited_total', plugin=name, result='queued')
+            timer = threading.Timer(
+                delay,
+                self._serve_queued,
+                args=[path, plugin, func, channel, user] + list(args)
+            )
+            timer.daemon = True
+            timer.start()
+            return None
+        return self._serve(path, plugin, func, channel, user, *args)
+
+    def _serve_queued(self, path, plugin, func, channel, user, *args):
+        if not self.client.running():
+            return
+        try:
+            res = self._serve(path, plugin, func, channel, user, *args)
+            if res:
+                self.client._handle_plugin_response(channel, res)
+        except Exception as err:
+            logger.error("Failed serving queued request", err, sys.exc_info())
+            self.client._handle_plugin_response(channel, "An error has occurred and been logged accordingly")
+
     def get_help_page(self, cmd):
         for item in self.help_pages:
             for k, v in item.items():
@@ -128,12 +308,13 @@ class PluginManager(object):
         return self.hook_manager.get_all_hooks()
 
     def get_cmd(self, msg):
-        cmd_trigger = config.get('command_trigger')
+        cmd_trigger = self.command_trigger
         if cmd_trigger:
             seed = msg.split()[0]
             if seed.startswith(cmd_trigger):
-                if self.hook_manager.get_cmd_hook(seed.lower()[1:]):
-                    return seed.lower()[1:], msg.split()[1:]
+                cmd = seed.lower()[1:]
+                if self.hook_manager.get_cmd_hook(cmd) or cmd in self.pending_hooks:
+                    return cmd, msg.split()[1:]
         return None, None
 
     def get_trigger(self, msg):
@@ -148,7 +329,14 @@ class PluginManager(object):
             args: {words}
             """
         )
-        return self.hook_manager.get_cmd_hook(cmd)._on_recv(channel, user, cmd, words)
+        plugin = self.hook_manager.get_cmd_hook(cmd)
+        if not plugin:
+            if cmd in self.pending_hooks:
+                return f"`{cmd}` is still starting up, try again in a moment"
+            # e.g. a mention intent naming a command no enabled plugin
+            # provides, or one whose setUp failed
+            return f"I don't know `{cmd}`, try `{self.command_trigger or ''}help`"
+        return self._serve_limited('cmd', plugin, plugin._on_recv, channel, user, cmd, words)
 
     def serve_trigger(self, channel, user, trigger, words):
         logger.debug(
@@ -159,7 +347,8 @@ class PluginManager(object):
             text: {' '.join(words)}
             """
         )
-        return self.hook_manager.get_trigger_hook(trigger)._on_trigger(channel, user, words)
+        plugin = self.hook_manager.get_trigger_hook(trigger)
+        return self._serve_limited('trigger', plugin, plugin._on_trigger, channel, user, words)
 
     def serve_context(self, channel, user, ctx, words):
         logger.debug(
@@ -169,10 +358,8 @@ class PluginManager(object):
             context: {vars(ctx)}
             """
         )
-        return self.hook_manager.get_hook_by_name(ctx.plugin)._on_context(channel, user, ctx, words)
+        plugin = self.hook_manager.get_hook_by_name(ctx.plugin)
+        return self._serve('context', plugin, plugin._on_context, channel, user, ctx, words)
 
     def serve_mention(self, channel, user, words):
-        chatterbot = self.hook_manager.get_hook_by_name('chatterbot')
-        if chatterbot:
-            return chatterbot._on_recv(channel, user, "", words)
-        return None
+        return self.mention_chain.serve(self, channel, user, ' '.join(words))
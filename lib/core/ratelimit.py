@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+import math
+import time
+import threading
+
+from ..cache import TTLCache
+from ..config import SlackBotConfig as config
+
+
+SCOPES = ['user', 'channel', 'plugin']
+MODES = ['reject', 'queue']
+
+
+class TokenBucket(object):
+    # Buckets are stored as (tokens, stamp) tuples and dropped once they
+    # would have refilled, a missing key is the same as a full bucket
+
+    def __init__(self, rate, per=60, burst=None):
+        self.rate = float(rate) / per
+        self.burst = float(burst or rate)
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.next_sweep = time.monotonic() + self.burst / self.rate
+
+    def __len__(self):
+        return len(self.buckets)
+
+    def _refill(self, key, now):
+        tokens, stamp = self.buckets.get(key, (self.burst, now))
+        return min(self.burst, tokens + (now - stamp) * self.rate)
+
+    def acquire(self, key, max_debt=0):
+        # Returns (allowed, delay). A positive delay on an allowed request
+        # means the token was borrowed and the caller should wait that long
+        now = time.monotonic()
+        with self.lock:
+            if now >= self.next_sweep:
+                self._sweep(now)
+            tokens = self._refill(key, now)
+            if tokens >= 1:
+                self.buckets[key] = (tokens - 1, now)
+                return True, 0.0
+            if tokens - 1 >= -max_debt:
+                self.buckets[key] = (tokens - 1, now)
+                return True, (1 - tokens) / self.rate
+            self.buckets[key] = (tokens, now)
+            return False, (1 - tokens) / self.rate
+
+    def refund(self, key):
+        now = time.monotonic()
+        with self.lock:
+            self.buckets[key] = (min(self.burst, self._refill(key, now) + 1), now)
+
+    def _sweep(self, now):
+        self.buckets = {
+            k: v for k, v in self.buckets.items()
+            if v[0] + (now - v[1]) * self.rate < self.burst
+        }
+        self.next_sweep = now + self.burst / self.rate
+
+
+class RateLimiter(object):
+
+    def __init__(self, rules, mode='reject', max_queued=2, exempt_admins=True):
+        if mode not in MODES:
+            raise ValueError(f"Unknown rate limit mode: {mode}")
+        self.mode = mode
+        self.max_queued = max_queued if mode == 'queue' else 0
+        self.exempt_admins = exempt_admins
+        self.rules = {}
+        for plugin, scopes in rules.items():
+            for scope, opts in (scopes or {}).items():
+                if scope not in SCOPES:
+                    raise ValueError(f"Unknown rate limit scope for {plugin}: {scope}")
+                self.rules.setdefault(plugin, {})[scope] = TokenBucket(
+                    opts['rate'],
+                    per=opts.get('per') or 60,
+                    burst=opts.get('burst')
+                )
+        # Only tell a user they are limited once per window
+        self.notified = TTLCache(maxsize=1000, ttl=60)
+
+    @classmethod
+    def from_config(cls):
+        opts = config.get('rate_limits')
+        if not opts or not opts.get('plugins'):
+            return None
+        return cls(
+            opts['plugins'],
+            mode=opts.get('mode') or 'reject',
+            max_queued=opts.get('max_queued') or 2,
+            exempt_admins=opts.get('exempt_admins') is not False
+        )
+
+    def _keys(self, plugin, channel, user_id):
+        return {'user': (plugin, user_id), 'channel': (plugin, channel), 'plugin': plugin}
+
+    def acquire(self, plugin, channel, user_id):
+        buckets = self.rules.get(plugin) or self.rules.get('*')
+        if not buckets:
+            return True, 0.0
+        keys = self._keys(plugin, channel, user_id)
+        taken = []
+        delay = 0.0
+        for scope, bucket in buckets.items():
+            allowed, wait = bucket.acquire(keys[scope], self.max_queued)
+            if not allowed:
+                for prev_scope, prev in taken:
+                    prev.refund(keys[prev_scope])
+                return False, wait
+            taken.append((scope, bucket))
+            delay = max(delay, wait)
+        return True, delay
+
+    def rejection(self, plugin, user_id, retry_after):
+        key = (plugin, user_id)
+        if self.notified.get(key):
+            return None
+        self.notified.set(key, True, ttl=retry_after)
+        return f"Slow down, `{plugin}` is rate limited. Try again in {math.ceil(retry_after)}s"
+
+    def size(self):
+        return sum(len(x) for scopes in self.rules.values() for x in scopes.values())
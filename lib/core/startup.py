@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+import time
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+from ..logging import SlackBotLogger as logger
+
+
+PHASES = ['import', 'setUp', 'hello']
+
+
+def format_bytes(size):
+    for unit in ['B', 'KiB', 'MiB']:
+        if abs(size) < 1024:
+            return f"{size:.0f}{unit}"
+        size /= 1024.0
+    return f"{size:.1f}GiB"
+
+
+class StartupReport(object):
+
+    def __init__(self, trace_memory=False):
+        self.lock = threading.Lock()
+        self.entries = []
+        self.started = time.monotonic()
+        # Tracing slows every allocation while plugins are already serving,
+        # so it is opt in. Only stop it on finish if we started it
+        self.owns_tracing = trace_memory and not tracemalloc.is_tracing()
+        if self.owns_tracing:
+            tracemalloc.start()
+        self.tracing_done = False
+
+    @contextmanager
+    def measure(self, phase, name):
+        start = time.perf_counter()
+        mem_start = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            memory = None
+            if mem_start is not None and tracemalloc.is_tracing():
+                memory = tracemalloc.get_traced_memory()[0] - mem_start
+            with self.lock:
+                self.entries.append((phase, name, elapsed, memory))
+
+    def has(self, phase):
+        with self.lock:
+            return any(x[0] == phase for x in self.entries)
+
+    def stop_tracing(self):
+        with self.lock:
+            if self.tracing_done:
+                return
+            self.tracing_done = True
+        if self.owns_tracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def render(self):
+        lines = ["Startup report (setUp runs concurrently, so its memory deltas overlap):"]
+        with self.lock:
+            entries = list(self.entries)
+        for phase in PHASES:
+            for entry_phase, name, elapsed, memory in entries:
+                if entry_phase != phase:
+                    continue
+                mem = format_bytes(memory) if memory is not None else '-'
+                lines.append(f"    {phase:<7} {name:<20} {elapsed * 1000:>10.1f}ms {mem:>10}")
+        lines.append(f"    total   {'':<20} {(time.monotonic() - self.started) * 1000:>10.1f}ms")
+        return '\n'.join(lines)
+
+    def log(self):
+        logger.info(self.render())
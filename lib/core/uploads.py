@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+import io
+import zlib
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+class IterStream(io.RawIOBase):
+    # Read-only file object over an iterable of str/bytes chunks, so
+    # generated output is pulled on demand instead of joined up front
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.pending = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def _next_chunk(self):
+        for chunk in self.chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            if chunk:
+                return memoryview(chunk)
+        return memoryview(b'')
+
+    def readinto(self, buf):
+        if not self.pending:
+            self.pending = self._next_chunk()
+            if not self.pending:
+                return 0
+        size = min(len(buf), len(self.pending))
+        buf[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+
+class CountingStream(io.RawIOBase):
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buf):
+        data = self.raw.read(len(buf))
+        if not data:
+            return 0
+        buf[:len(data)] = data
+        self.bytes_read += len(data)
+        return len(data)
+
+    def close(self):
+        self.raw.close()
+        super().close()
+
+
+class GzipStream(io.RawIOBase):
+    # Compresses another readable as it is read
+
+    def __init__(self, raw, level=6):
+        self.raw = raw
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        self.pending = b''
+        self.eof = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buf):
+        while not self.pending and not self.eof:
+            data = self.raw.read(CHUNK_SIZE)
+            if data:
+                self.pending = self.compressor.compress(data)
+            else:
+                self.pending = self.compressor.flush()
+                self.eof = True
+        size = min(len(buf), len(self.pending))
+        buf[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+    def close(self):
+        self.raw.close()
+        super().close()
+
+
+def open_upload(content=None, path=None, compress=False):
+    # content may be str, bytes, a readable file object or an iterable of
+    # chunks. The result counts bytes read through .raw.bytes_read
+    if path is not None:
+        stream = open(path, 'rb', buffering=0)
+    elif isinstance(content, str):
+        stream = io.BytesIO(content.encode())
+    elif isinstance(content, (bytes, bytearray, memoryview)):
+        stream = io.BytesIO(content)
+    elif hasattr(content, 'read'):
+        stream = content
+    else:
+        stream = IterStream(content)
+    if compress:
+        stream = GzipStream(stream)
+    return io.BufferedReader(CountingStream(stream), CHUNK_SIZE)
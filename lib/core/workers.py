@@ -0,0 +1,582 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import atexit
+import signal
+import socket
+import weakref
+import itertools
+import threading
+import traceback
+import tracemalloc
+import importlib.util
+import multiprocessing
+import multiprocessing.util
+from multiprocessing import reduction
+from multiprocessing.connection import Connection
+from concurrent.futures import ThreadPoolExecutor
+
+from ..config import SlackBotConfig as config
+from ..logging import SlackBotLogger as logger
+from ..metrics import SlackBotMetrics as metrics
+from ..tracing import SlackBotTracer as tracer
+from ..db.database import get_caller as db_subject
+from .context import Context
+from .exceptions import PluginWorkerError
+
+
+# Wire format, pickled over a duplex pipe in both directions:
+#   ('req', id, target, name, args, kwargs)
+#   ('res', id, ok, value)
+#   ('exit',)
+# Targets are 'plugin' and 'meta' in the worker, 'client', 'contexts',
+# 'db', 'meta' and ('ctx', id) in the bot. Values cross the pipe as copies,
+# so a worker changing what ctx.get returned has to ctx.set it back
+
+CALLABLE = '__callable__'
+
+
+class CtxRef(object):
+
+    def __init__(self, ctx_id):
+        self.ctx_id = ctx_id
+
+
+class Channel(object):
+    # Either end of a worker pipe. Requests from the other side are run on
+    # the executor so a plugin call can make client calls while it waits
+
+    def __init__(self, conn, handler, executor):
+        self.conn = conn
+        self.handler = handler
+        self.executor = executor
+        self.send_lock = threading.Lock()
+        self.pending = {}
+        self.ids = itertools.count()
+        self.closed = False
+
+    def send(self, msg):
+        with self.send_lock:
+            self.conn.send(msg)
+
+    def call(self, target, name, args=(), kwargs=None, timeout=None):
+        if self.closed:
+            raise PluginWorkerError("worker pipe is closed")
+        call_id = next(self.ids)
+        slot = [threading.Event(), None]
+        self.pending[call_id] = slot
+        try:
+            self.send(('req', call_id, target, name, list(args), kwargs or {}))
+            if not slot[0].wait(timeout):
+                raise PluginWorkerError(f"{name} timed out after {timeout}s")
+        except (OSError, EOFError) as err:
+            raise PluginWorkerError(f"worker pipe failed: {err}")
+        finally:
+            self.pending.pop(call_id, None)
+        ok, value = slot[1]
+        if not ok:
+            raise PluginWorkerError(value)
+        return value
+
+    def serve(self):
+        while True:
+            try:
+                msg = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            if msg[0] == 'exit':
+                break
+            if msg[0] == 'res':
+                slot = self.pending.get(msg[1])
+                if slot:
+                    slot[1] = (msg[2], msg[3])
+                    slot[0].set()
+            else:
+                self.executor.submit(self._handle, msg)
+        self.close()
+
+    def close(self):
+        self.closed = True
+        for slot in list(self.pending.values()):
+            slot[1] = (False, "worker exited")
+            slot[0].set()
+        try:
+            self.conn.close()
+        except OSError:
+            pass
+
+    def _handle(self, msg):
+        _, call_id, target, name, args, kwargs = msg
+        try:
+            reply = ('res', call_id, True, self.handler(target, name, args, kwargs))
+        except Exception:
+            reply = ('res', call_id, False, traceback.format_exc())
+        try:
+            self.send(reply)
+        except (OSError, EOFError):
+            pass
+        except Exception:
+            self.send(('res', call_id, False, f"unpicklable result from {name}: {traceback.format_exc()}"))
+
+
+# Worker side
+
+class Remote(object):
+    # Stands in for a bot side object, attributes are fetched over the pipe
+    # and methods are called there
+
+    def __init__(self, channel, target):
+        self._channel = channel
+        self._target = target
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        value = self._channel.call(self._target, '__getattr__', [name])
+        if value != CALLABLE:
+            return _decode(self._channel, value)
+
+        def method(*args, **kwargs):
+            return _decode(self._channel, self._channel.call(self._target, name, args, kwargs))
+        self.__dict__[name] = method
+        return method
+
+    def __setattr__(self, name, value):
+        if name.startswith('_'):
+            return super().__setattr__(name, value)
+        self._channel.call(self._target, '__setattr__', [name, value])
+
+    def __reduce__(self):
+        if isinstance(self._target, tuple):
+            return (CtxRef, (self._target[1],))
+        raise TypeError(f"{self._target} can not be sent to the bot")
+
+
+class RemoteDatabase(object):
+    # Subjects are resolved in the worker, where the plugin's own files are
+    # on the stack. update runs fn locally and retries it on a conflict, so
+    # fn must only compute the new values
+
+    def __init__(self, channel):
+        self.channel = channel
+
+    def get_value(self, key):
+        return self.channel.call('db', 'get_many', [db_subject(), [key]])[key]
+
+    def store_value(self, key, value):
+        return self.channel.call('db', 'store_many', [db_subject(), {key: value}])
+
+    def get_many(self, keys):
+        return self.channel.call('db', 'get_many', [db_subject(), keys])
+
+    def store_many(self, values):
+        return self.channel.call('db', 'store_many', [db_subject(), values])
+
+    def compare_and_set(self, key, expected, value):
+        return self.channel.call('db', 'compare_and_set', [db_subject(), key, expected, value])
+
+    def update(self, key, fn):
+        return self._update(db_subject(), [key], lambda x: {key: fn(x[key])})[key]
+
+    def update_many(self, keys, fn):
+        return self._update(db_subject(), keys, fn)
+
+    def _update(self, subject, keys, fn):
+        while True:
+            current = self.channel.call('db', 'get_many', [subject, keys])
+            updated = fn(dict(current))
+            if self.channel.call('db', 'swap_many', [subject, current, updated or {}]):
+                return updated
+
+    def stats(self):
+        return self.channel.call('db', 'stats')
+
+
+class RemoteClient(Remote):
+
+    def __init__(self, channel):
+        super().__init__(channel, 'client')
+        self.__dict__['db'] = RemoteDatabase(channel)
+        self.__dict__['contexts'] = Remote(channel, 'contexts')
+        self.__dict__['stop'] = threading.Event()
+
+    def register_loop(self, function, args=[], interval=10, leader_only=False):
+        # Loops run in the worker, next to the state they touch
+        stop = self.__dict__['stop']
+
+        def loop():
+            stop.wait(interval)
+            while not stop.is_set():
+                try:
+                    if not leader_only or self._channel.call('meta', 'is_leader'):
+                        function(*args)
+                except Exception as err:
+                    logger.error(f"Exception while running worker loop {function.__name__}", err, sys.exc_info())
+                stop.wait(interval)
+        threading.Thread(target=loop, daemon=True).start()
+
+
+def _decode(channel, value):
+    if isinstance(value, CtxRef):
+        return Remote(channel, ('ctx', value.ctx_id))
+    return value
+
+
+def _worker_main(conn, plugin_class, threads, inherited):
+    # Forked from the bot with the plugin module already imported. Only the
+    # forking thread survives, so drop what belonged to the others
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    metrics.lock = threading.Lock()
+    tracer.exporter = None
+    for other in inherited:
+        try:
+            other.close()
+        except OSError:
+            pass
+    plugin = None
+    executor = ThreadPoolExecutor(max_workers=threads)
+
+    def handle(target, name, args, kwargs):
+        nonlocal plugin
+        if target == 'meta' and name == 'setup':
+            # Sent once the plugin's dependencies are set up in the bot
+            plugin = plugin_class(client=client)
+            plugin._setUp()
+            return {
+                key: list(getattr(plugin, key))
+                for key in ['hooks', 'help_pages', 'trigger_regexes']
+                if isinstance(getattr(plugin, key, None), list)
+            }
+        if target == 'meta' and name == 'teardown':
+            client.stop.set()
+            if hasattr(plugin, 'tearDown'):
+                plugin.tearDown()
+            return None
+        args = [_decode(channel, x) for x in args]
+        return getattr(plugin, name)(*args, **kwargs)
+
+    channel = Channel(conn, handle, executor)
+    client = RemoteClient(channel)
+    channel.serve()
+    client.stop.set()
+
+
+# Zygote
+
+def load_plugin(path):
+    spec = importlib.util.spec_from_file_location("module.name", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.SlackBotPlugin
+
+
+def _zygote_main(sock):
+    # Single threaded for its whole life, so forking from here never copies
+    # a lock some other thread was holding
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Daemonic to the bot, which kills it on exit, but it has to be allowed
+    # children. Its workers are daemonic so they go with it
+    multiprocessing.current_process().daemon = False
+    conn = Connection(os.dup(sock.fileno()))
+    while True:
+        try:
+            if not conn.poll(0.2):
+                # Reaps workers that exited
+                multiprocessing.active_children()
+                continue
+            msg = conn.recv()
+        except (EOFError, OSError):
+            break
+        _, path, name, threads = msg
+        try:
+            # Plugins may have changed since the bot started, reloads get
+            # the current code and config
+            config.load_config()
+            plugin_class = load_plugin(path)
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.get_context('fork').Process(
+                target=_worker_main,
+                args=(child, plugin_class, threads, [parent, conn, sock]),
+                name=f"plugin-{name}",
+                daemon=True
+            )
+            process.start()
+            child.close()
+        except Exception:
+            conn.send(('error', traceback.format_exc()))
+            continue
+        conn.send(('ok', process.pid))
+        reduction.sendfds(sock, [parent.fileno()])
+        parent.close()
+
+
+class Zygote(object):
+    # Forked by the bot before it starts any threads. Every worker, including
+    # restarts and the ones created by a plugin reload, is forked from it
+    # rather than from the running bot
+
+    instance = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sock, child = socket.socketpair()
+        self.process = multiprocessing.get_context('fork').Process(
+            target=_zygote_main,
+            args=(child,),
+            name="plugin-zygote",
+            daemon=True
+        )
+        self.process.start()
+        child.close()
+        self.conn = Connection(os.dup(self.sock.fileno()))
+
+    @classmethod
+    def start(cls):
+        if cls.instance is None or not cls.instance.process.is_alive():
+            cls.instance = cls()
+            logger.debug(f"Started plugin zygote {cls.instance.process.pid}")
+        return cls.instance
+
+    def spawn(self, path, name, threads):
+        with self.lock:
+            try:
+                self.conn.send(('spawn', path, name, threads))
+                status, value = self.conn.recv()
+                if status != 'ok':
+                    raise PluginWorkerError(f"zygote failed to fork {name}: {value}")
+                fd = reduction.recvfds(self.sock, 1)[0]
+            except (EOFError, OSError) as err:
+                raise PluginWorkerError(f"zygote is gone: {err}")
+        return ZygoteChild(value), Connection(fd)
+
+
+class ZygoteChild(object):
+    # A worker forked by the zygote, it isn't our child so it can only be
+    # watched and signalled by pid
+
+    exitcode = None
+
+    def __init__(self, pid):
+        self.pid = pid
+
+    def is_alive(self):
+        try:
+            os.kill(self.pid, 0)
+        except ProcessLookupError:
+            return False
+        return True
+
+    def join(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.is_alive() and (deadline is None or time.monotonic() < deadline):
+            time.sleep(0.05)
+
+    def terminate(self):
+        try:
+            os.kill(self.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+
+# Bot side
+
+class PluginWorker(object):
+    # Registered with the HookManager in place of the plugin, every call is
+    # proxied to a forked process running the real one
+
+    hosts = weakref.WeakSet()
+
+    def __init__(self, client, name, plugin_class, path=None, timeout=120, threads=4):
+        self.client = client
+        self.name = name
+        self.plugin_class = plugin_class
+        self.path = path
+        self.depends_on = getattr(plugin_class, 'depends_on', [])
+        # Until the worker reports them after setUp
+        for key in ['hooks', 'help_pages', 'trigger_regexes']:
+            if isinstance(getattr(plugin_class, key, None), list):
+                setattr(self, key, list(getattr(plugin_class, key)))
+        self.timeout = timeout
+        self.threads = threads
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix=f"worker-{name}")
+        self.channel = None
+        self.process = None
+        self.stopping = False
+        self.restarts = 0
+        self.ctx_ids = weakref.WeakKeyDictionary()
+        self.ctxs = weakref.WeakValueDictionary()
+        self.ids = itertools.count()
+        self.ready = False
+
+    def start(self):
+        # Only forks, the plugin manager calls this for every worker before
+        # it starts any setUp threads
+        self.ready = False
+        if Zygote.instance and self.path:
+            process, parent = Zygote.instance.spawn(self.path, self.name, self.threads)
+        else:
+            # No zygote, e.g. a bot embedded by something else. Forking the
+            # running bot copies whatever locks its other threads hold, the
+            # worker only resets the metrics lock, tracer and tracemalloc
+            parent, child = multiprocessing.Pipe()
+            inherited = [x.channel.conn for x in list(PluginWorker.hosts) if x.channel]
+            process = multiprocessing.get_context('fork').Process(
+                target=_worker_main,
+                args=(child, self.plugin_class, self.threads, inherited + [parent]),
+                name=f"plugin-{self.name}",
+                daemon=True
+            )
+            process.start()
+            child.close()
+        self.process = process
+        PluginWorker.hosts.add(self)
+        channel = self.channel = Channel(parent, self._handle, self.executor)
+        threading.Thread(target=self._serve, args=[channel, process], daemon=True).start()
+
+    def _setUp(self):
+        try:
+            if self.process is None:
+                self.start()
+            self._setup_worker()
+        except Exception as err:
+            # Retried with the same backoff as a crashed worker, calls fail
+            # until it comes up
+            logger.error(f"Worker for {self.name} failed to set up, retrying", err, sys.exc_info())
+            threading.Thread(target=self._restart, args=[1], daemon=True).start()
+
+    def _setup_worker(self):
+        try:
+            attrs = self.channel.call('meta', 'setup', timeout=self.timeout)
+        except PluginWorkerError as err:
+            self._kill()
+            raise PluginWorkerError(f"{self.name} failed to set up in its worker: {err}")
+        for key, items in attrs.items():
+            setattr(self, key, items)
+        self.ready = True
+        logger.info(f"Started worker process {self.process.pid} for {self.name}")
+
+    def _kill(self):
+        self.process.terminate()
+        self.process.join(5)
+
+    def _serve(self, channel, process):
+        channel.serve()
+        process.join(5)
+        # A worker that never came up is retried by _restart
+        if self.stopping or not self.ready:
+            return
+        metrics.inc('slackbot_plugin_worker_restarts_total', plugin=self.name)
+        logger.info(f"Worker for {self.name} exited with {process.exitcode}, restarting", format_opts=["fail"])
+        self._restart()
+
+    def _restart(self, wait=0):
+        delay = 1
+        time.sleep(wait)
+        while not self.stopping:
+            try:
+                self.start()
+                self._setup_worker()
+                return
+            except Exception as err:
+                logger.error(f"Failed to restart worker for {self.name}", err, sys.exc_info())
+            time.sleep(delay)
+            delay = min(delay * 2, 60)
+
+    def _handle(self, target, name, args, kwargs):
+        # Requests from the worker
+        if target == 'meta':
+            if name == 'is_leader':
+                cluster = self.client.cluster
+                return not cluster or cluster.is_leader()
+        if target == 'db':
+            return self._db(name, *args)
+        if isinstance(target, tuple):
+            obj = self.ctxs.get(target[1])
+            if obj is None:
+                raise PluginWorkerError("context is gone")
+        else:
+            obj = self.client.contexts if target == 'contexts' else self.client
+        if name == '__getattr__':
+            value = getattr(obj, args[0])
+            return CALLABLE if callable(value) else self._encode(value)
+        if name == '__setattr__':
+            # Only contexts, values read from them are copies so changes
+            # have to come back through ctx.set or an assignment
+            if not isinstance(target, tuple) or args[0].startswith('_'):
+                raise PluginWorkerError(f"can not set {args[0]} on {target}")
+            return setattr(obj, args[0], args[1])
+        if name.startswith('_'):
+            raise PluginWorkerError(f"{name} is private")
+        if target == 'contexts' and name == 'new_context':
+            kwargs['plugin'] = self.name
+        args = [self.ctxs.get(x.ctx_id) if isinstance(x, CtxRef) else x for x in args]
+        return self._encode(getattr(obj, name)(*args, **kwargs))
+
+    def _db(self, name, subject, *args):
+        engine = self.client.db.engine
+        if name == 'swap_many':
+            expected, values = args
+            swapped = []
+
+            def swap(current):
+                if current != expected:
+                    return None
+                swapped.append(True)
+                return values
+            engine._update_many(subject, list(expected), swap)
+            return bool(swapped)
+        if name == 'stats':
+            return engine.stats()
+        return getattr(engine, f"_{name}")(subject, *args)
+
+    def _encode(self, value):
+        if not isinstance(value, Context):
+            return value
+        ctx_id = self.ctx_ids.get(value)
+        if ctx_id is None:
+            ctx_id = self.ctx_ids[value] = next(self.ids)
+            self.ctxs[ctx_id] = value
+        return CtxRef(ctx_id)
+
+    def _invoke(self, name, *args):
+        channel = self.channel
+        if channel is None or channel.closed:
+            raise PluginWorkerError(f"{self.name} worker is restarting")
+        return channel.call('plugin', name, [self._encode(x) for x in args], timeout=self.timeout)
+
+    def _on_recv(self, channel, user, cmd, words):
+        return self._invoke('_on_recv', channel, user, cmd, words)
+
+    def _on_trigger(self, channel, user, words):
+        return self._invoke('_on_trigger', channel, user, words)
+
+    def _on_context(self, channel, user, ctx, words):
+        return self._invoke('_on_context', channel, user, ctx, words)
+
+    def tearDown(self):
+        self.stopping = True
+        channel = self.channel
+        if channel and not channel.closed:
+            try:
+                channel.call('meta', 'teardown', timeout=self.timeout)
+                channel.send(('exit',))
+            except (PluginWorkerError, OSError) as err:
+                logger.error(f"Failed to stop worker for {self.name}", err, sys.exc_info())
+        if self.process:
+            self.process.join(5)
+            if self.process.is_alive():
+                self.process.terminate()
+        self.executor.shutdown(wait=False)
+
+
+@atexit.register
+def _stop_restarts():
+    # Registered after multiprocessing.util's exit hook so it runs first,
+    # that hook terminates the workers which would otherwise look like
+    # crashes and be restarted
+    for worker in list(PluginWorker.hosts):
+        worker.stopping = True
@@ -0,0 +1,5 @@
+#!/usr/bin/env python3
+
+from .corpus import LineCorpus
+from .nltkdata import ensure_nltk_data
+from .text import normalize
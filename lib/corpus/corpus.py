@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import mmap
+import random
+import struct
+from array import array
+
+from ..logging import SlackBotLogger as logger
+
+
+INDEX_MAGIC = b'SBLIDX01'
+# magic, source size, source mtime (ns)
+INDEX_HEADER = struct.Struct('<8sQQ')
+
+
+class LineCorpus(object):
+
+    def __init__(self, path, index_path=None):
+        self.path = path
+        self.index_path = index_path or f"{path}.idx"
+        self.random = random.SystemRandom()
+        self.file = open(self.path, 'rb')
+        stat = os.fstat(self.file.fileno())
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime_ns
+        if self.size:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.data = b''
+        self.offsets = self._load_index()
+        if self.offsets is None:
+            self.offsets = self._build_index()
+            self._save_index()
+        logger.debug(f"Loaded corpus {self.path} with {len(self.offsets)} lines")
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, idx):
+        start = self.offsets[idx]
+        end = self.data.find(b'\n', start)
+        if end == -1:
+            end = self.size
+        return self.data[start:end].decode('utf-8', errors='replace').strip()
+
+    def __iter__(self):
+        for idx in range(len(self.offsets)):
+            yield self[idx]
+
+    def _build_index(self):
+        # Offsets of every non-blank line, 8 bytes apiece
+        offsets = array('Q')
+        start = 0
+        while start < self.size:
+            end = self.data.find(b'\n', start)
+            if end == -1:
+                end = self.size
+            if self.data[start:end].strip():
+                offsets.append(start)
+            start = end + 1
+        return offsets
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'rb') as f:
+                header = f.read(INDEX_HEADER.size)
+                magic, size, mtime = INDEX_HEADER.unpack(header)
+                if magic != INDEX_MAGIC or size != self.size or mtime != self.mtime:
+                    return None
+                offsets = array('Q')
+                offsets.frombytes(f.read())
+                if sys.byteorder != 'little':
+                    offsets.byteswap()
+                return offsets
+        except (OSError, struct.error, ValueError):
+            return None
+
+    def _save_index(self):
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        offsets = array('Q', self.offsets)
+        if sys.byteorder != 'little':
+            offsets.byteswap()
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(INDEX_HEADER.pack(INDEX_MAGIC, self.size, self.mtime))
+                offsets.tofile(f)
+            os.replace(tmp_path, self.index_path)
+        except OSError as err:
+            logger.info(f"Could not cache line index for {self.path}: {err}")
+
+    def random_line(self):
+        if not self.offsets:
+            return None
+        return self[self.random.randrange(len(self.offsets))]
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+
+import os
+import threading
+from pathlib import Path
+from distutils.dir_util import copy_tree
+
+from ..logging import SlackBotLogger as logger
+
+
+# Plugins set up concurrently, so downloads are shared and done once per
+# process no matter how many plugins ask for the same package
+lock = threading.Lock()
+downloaded = set()
+
+
+def ensure_nltk_data(packages, data_dir=None):
+    import nltk
+    with lock:
+        missing = [x for x in packages if (x, data_dir) not in downloaded]
+        if not missing:
+            return
+        if data_dir:
+            nltk_dir = os.path.join(data_dir, "nltk_data")
+            if nltk_dir not in nltk.data.path:
+                nltk.data.path.insert(0, nltk_dir)
+        else:
+            nltk_dir = None
+        for pkg in missing:
+            logger.debug(f"Downloading nltk package {pkg}")
+            nltk.download(pkg, download_dir=nltk_dir, quiet=True)
+            downloaded.add((pkg, data_dir))
+        if nltk_dir:
+            copy_tree(nltk_dir, os.path.join(str(Path.home()), "nltk_data"))
@@ -0,0 +1,9 @@
+#!/usr/bin/env python3
+
+import re
+
+
+def normalize(text):
+    # Lowercased with punctuation and extra whitespace dropped, so
+    # "Good bot!" and "good  bot" compare equal
+    return ' '.join(re.sub(r'[^\w\s]', '', (text or '').lower()).split())
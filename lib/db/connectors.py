@@ -24,12 +24,33 @@ class DatabaseConnector(object):
         logger.debug(f"Storing value '{key}' for '{subject}'")
         return self.store_value(subject, key, value)
 
+    def _get_many(self, subject, keys):
+        logger.debug(f"Retrieving values {keys} for '{subject}'")
+        return self.get_many(subject, keys)
+
+    def _store_many(self, subject, values):
+        logger.debug(f"Storing values {list(values)} for '{subject}'")
+        return self.store_many(subject, values)
+
+    def _update_many(self, subject, keys, fn):
+        logger.debug(f"Updating values {keys} for '{subject}'")
+        return self.update_many(subject, keys, fn)
+
+    def _compare_and_set(self, subject, key, expected, value):
+        logger.debug(f"Compare and set of '{key}' for '{subject}'")
+        return self.compare_and_set(subject, key, expected, value)
+
 
 class InMemoryDatabase(DatabaseConnector):
 
     def setUp(self):
         self.config = config.get("memory")
         self.lock = threading.Lock()
+        # Writes to disk happen outside self.lock, this orders them
+        self.persist_lock = threading.Lock()
+        self.generation = 0
+        self.persisted = 0
+        self.persistence_enabled = False
         if self.config:
             if self.config.get("persistence") is True:
                 self.persistence_enabled = True
@@ -51,11 +72,64 @@ class InMemoryDatabase(DatabaseConnector):
             return self.db[subject].get(key)
         return None
 
+    def get_many(self, subject, keys):
+        values = self.db.get(subject) or {}
+        return {key: values.get(key) for key in keys}
+
+    def stats(self):
+        # Number of keys per subject
+        return {subject: len(keys) for subject, keys in list(self.db.items())}
+
+    def _snapshot(self):
+        # Called under self.lock, only the serialization is
+        if not self.persistence_enabled:
+            return None
+        self.generation += 1
+        return self.generation, json.dumps(self.db)
+
+    def _persist(self, snapshot):
+        # Compressed and written after self.lock is released. A snapshot older
+        # than the one already on disk is dropped
+        if snapshot is None:
+            return
+        generation, data = snapshot
+        with self.persist_lock:
+            if generation <= self.persisted:
+                return
+            tmp_path = f"{self.db_path}.tmp"
+            with gzip.open(tmp_path, "wb") as f:
+                f.write(data.encode())
+            os.replace(tmp_path, self.db_path)
+            self.persisted = generation
+
     def store_value(self, subject, key, value):
+        self.store_many(subject, {key: value})
+
+    def store_many(self, subject, values):
+        with self.lock:
+            self.db.setdefault(subject, {}).update(values)
+            snapshot = self._snapshot()
+        self._persist(snapshot)
+
+    def update_many(self, subject, keys, fn):
+        # fn gets the current values and returns the ones to store, all under
+        # one lock and one persist. It should build new values rather than
+        # mutate the ones it is given, and have no other side effects since
+        # plugins in a worker process retry it on a conflicting write
+        snapshot = None
+        with self.lock:
+            updated = fn(self.get_many(subject, keys))
+            if updated:
+                self.db.setdefault(subject, {}).update(updated)
+                snapshot = self._snapshot()
+        self._persist(snapshot)
+        return updated
+
+    def compare_and_set(self, subject, key, expected, value):
         with self.lock:
-            if not self.db.get(subject):
-                self.db[subject] = {}
-            self.db[subject][key] = value
-            if self.persistence_enabled:
-                with gzip.open(self.db_path, "wb") as f:
-                    f.write(json.dumps(self.db).encode())
+            if self.get_value(subject, key) != expected:
+                return False
+            self.db.setdefault(subject, {})[key] = value
+            snapshot = self._snapshot()
+        self._persist(snapshot)
+        return True
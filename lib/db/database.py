@@ -28,3 +28,23 @@ class DatabaseSession(object):
 
     def store_value(self, key, value):
         return self.engine._store_value(get_caller(), key, value)
+
+    def get_many(self, keys):
+        return self.engine._get_many(get_caller(), keys)
+
+    def store_many(self, values):
+        return self.engine._store_many(get_caller(), values)
+
+    def update(self, key, fn):
+        # Atomically replaces the value with fn(current) and returns it
+        updated = self.engine._update_many(get_caller(), [key], lambda x: {key: fn(x[key])})
+        return updated[key]
+
+    def update_many(self, keys, fn):
+        return self.engine._update_many(get_caller(), keys, fn)
+
+    def compare_and_set(self, key, expected, value):
+        return self.engine._compare_and_set(get_caller(), key, expected, value)
+
+    def stats(self):
+        return self.engine.stats()
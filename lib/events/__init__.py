@@ -0,0 +1,3 @@
+#!/usr/bin/env python3
+
+from .receiver import EventsReceiver, verify_signature
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+import hmac
+import sys
+import json
+import time
+import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+from ..cache import TTLCache
+from ..config import SlackBotConfig as config
+from ..logging import SlackBotLogger as logger
+from ..metrics import SlackBotMetrics as metrics
+from ..core.exceptions import MissingSigningSecret
+
+
+# Slack rejects anything older than five minutes to stop replayed requests
+MAX_REQUEST_AGE = 60 * 5
+
+
+def sign(secret, timestamp, body):
+    basestring = b"v0:" + str(timestamp).encode() + b":" + body
+    digest = hmac.new(secret.encode(), basestring, hashlib.sha256).hexdigest()
+    return f"v0={digest}"
+
+
+def verify_signature(secret, timestamp, signature, body, now=None):
+    try:
+        age = abs((now or time.time()) - int(timestamp))
+    except (TypeError, ValueError):
+        return False
+    if age > MAX_REQUEST_AGE or not signature:
+        return False
+    return hmac.compare_digest(sign(secret, timestamp, body), signature)
+
+
+class EventsReceiver(object):
+
+    def __init__(self, client, signing_secret, web_client, host='0.0.0.0', port=3000,
+                 path='/slack/events', workers=8, dedup_ttl=600):
+        self.client = client
+        self.signing_secret = signing_secret
+        self.web_client = web_client
+        self.host = host
+        self.port = port
+        self.path = path
+        self.dedup_ttl = dedup_ttl
+        self.seen = TTLCache(maxsize=10000, ttl=dedup_ttl)
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.loop = None
+        self.app = web.Application()
+        self.app.router.add_post(path, self.handle_event)
+        self.app.router.add_get('/healthz', self.handle_health)
+
+    @classmethod
+    def from_config(cls, client, web_client):
+        signing_secret = config.get('signing_secret')
+        if not signing_secret:
+            raise MissingSigningSecret
+        return cls(
+            client,
+            signing_secret,
+            web_client,
+            host=config.get('host') or '0.0.0.0',
+            port=config.get('port') or 3000,
+            path=config.get('path') or '/slack/events',
+            workers=config.get('workers') or 8,
+            dedup_ttl=config.get('dedup_ttl') or 600
+        )
+
+    async def handle_health(self, request):
+        return web.Response(text="ok")
+
+    async def handle_event(self, request):
+        body = await request.read()
+        if not verify_signature(
+            self.signing_secret,
+            request.headers.get('X-Slack-Request-Timestamp'),
+            request.headers.get('X-Slack-Signature'),
+            body
+        ):
+            metrics.inc('slackbot_events_total', result='bad_signature')
+            return web.Response(status=401, text="invalid signature")
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return web.Response(status=400, text="invalid payload")
+        if payload.get('type') == 'url_verification':
+            return web.json_response({"challenge": payload.get('challenge')})
+        if payload.get('type') != 'event_callback':
+            return web.Response(text="")
+        event_id = payload.get('event_id')
+        if event_id and not await self._claim(event_id):
+            metrics.inc('slackbot_events_total', result='duplicate')
+            logger.debug(f"Dropping redelivered event {event_id} (retry {request.headers.get('X-Slack-Retry-Num')})")
+            return web.Response(text="")
+        event = payload.get('event') or {}
+        if event.get('type') == 'message':
+            metrics.inc('slackbot_events_total', result='accepted')
+            self.pool.submit(self._dispatch, event)
+        else:
+            metrics.inc('slackbot_events_total', result='ignored')
+        # Ack straight away, Slack retries anything slower than three seconds
+        return web.Response(text="")
+
+    async def _claim(self, event_id):
+        if not self.seen.add(event_id, True):
+            return False
+        # A retry can land on another instance, without a cluster store to
+        # share the claim the load balancer has to route by event_id
+        cluster = getattr(self.client, 'cluster', None)
+        if not cluster:
+            return True
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                None, cluster.claim_event, event_id, self.dedup_ttl
+            )
+        except Exception as err:
+            # Better a rare duplicate than a dropped message
+            logger.error(f"Failed to claim event {event_id}", err, sys.exc_info())
+            return True
+
+    def _dispatch(self, event):
+        self.client.handle_message({"data": event, "web_client": self.web_client})
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        runner = web.AppRunner(self.app, access_log=None)
+        self.loop.run_until_complete(runner.setup())
+        self.loop.run_until_complete(web.TCPSite(runner, self.host, self.port).start())
+        logger.info(f"Listening for slack events on http://{self.host}:{self.port}{self.path}")
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.run_until_complete(runner.cleanup())
+            self.pool.shutdown(wait=False)
+            self.loop.close()
+
+    def stop(self):
+        if self.loop:
+            self.loop.call_soon_threadsafe(self.loop.stop)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+import sys
+import json
+import time
+import uuid
+import argparse
+import urllib.request
+import urllib.error
+
+from .receiver import sign
+
+
+def build_event(channel, user, text):
+    now = time.time()
+    return {
+        "type": "event_callback",
+        "team_id": "TFAKE",
+        "event_id": f"Ev{uuid.uuid4().hex[:10].upper()}",
+        "event_time": int(now),
+        "event": {
+            "type": "message",
+            "channel": channel,
+            "user": user,
+            "text": text,
+            "ts": "%.6f" % now,
+            "client_msg_id": str(uuid.uuid4())
+        }
+    }
+
+
+def post(url, secret, payload, retry_num=None, bad_signature=False):
+    body = json.dumps(payload).encode()
+    timestamp = str(int(time.time()))
+    signature = sign(secret, timestamp, body)
+    if bad_signature:
+        signature = signature[:-4] + '0000'
+    headers = {
+        "Content-Type": "application/json",
+        "X-Slack-Request-Timestamp": timestamp,
+        "X-Slack-Signature": signature,
+    }
+    if retry_num is not None:
+        headers["X-Slack-Retry-Num"] = str(retry_num)
+        headers["X-Slack-Retry-Reason"] = "http_timeout"
+    request = urllib.request.Request(url, data=body, headers=headers, method='POST')
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request) as response:
+            status, text = response.status, response.read().decode()
+    except urllib.error.HTTPError as err:
+        status, text = err.code, err.read().decode()
+    return status, text, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog='python -m lib.events.sender',
+        description='Send signed Events API callbacks to a local receiver'
+    )
+    parser.add_argument('--url', default='http://127.0.0.1:3000/slack/events')
+    parser.add_argument('--secret', required=True, help='signing secret configured on the receiver')
+    parser.add_argument('--channel', default='CEVENTS')
+    parser.add_argument('--user', default='U00000')
+    parser.add_argument('-t', '--text', default='!help')
+    parser.add_argument('-n', '--count', type=int, default=1, help='distinct events to send')
+    parser.add_argument('--retries', type=int, default=0, help='redeliveries of each event, as Slack does on timeouts')
+    parser.add_argument('--verify', action='store_true', help='send a url_verification challenge first')
+    parser.add_argument('--bad-signature', action='store_true', help='send with a corrupted signature')
+    args = parser.parse_args()
+
+    if args.verify:
+        status, text, elapsed = post(args.url, args.secret, {"type": "url_verification", "challenge": "fake-challenge"})
+        print(f"url_verification: {status} {text} ({elapsed * 1000:.1f}ms)")
+    for _ in range(args.count):
+        payload = build_event(args.channel, args.user, args.text)
+        for retry in range(args.retries + 1):
+            status, text, elapsed = post(
+                args.url,
+                args.secret,
+                payload,
+                retry_num=retry or None,
+                bad_signature=args.bad_signature
+            )
+            print(f"{payload['event_id']} attempt {retry + 1}: {status} ({elapsed * 1000:.1f}ms)")
+            if status >= 400:
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
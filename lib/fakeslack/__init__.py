@@ -0,0 +1,4 @@
+#!/usr/bin/env python3
+
+from .server import FakeSlackServer
+from .loadgen import LoadGenerator
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+import sys
+import json
+import asyncio
+import argparse
+
+from ..logging import SlackBotLogger as logger
+from .server import FakeSlackServer
+from .loadgen import LoadGenerator
+
+
+class _Config(object):
+
+    @classmethod
+    def get(cls, key):
+        return None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        prog='python -m lib.fakeslack',
+        description='Run a local Slack RTM/Web API stand-in and optionally drive load through it'
+    )
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--bot-name', default='slackbot', help='must match bot_name in the bot config')
+    parser.add_argument('--users', type=int, default=100, help='synthetic users returned by users.list')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every web api call')
+    parser.add_argument('--jitter', type=float, default=0.0, help='random extra latency up to this many seconds')
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='fraction of web api calls answered with 429')
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--disconnect-every', type=float, default=0, help='close the rtm websocket every N seconds')
+    parser.add_argument('--redeliver', type=float, default=0.0, help='fraction of messages sent twice, as slack does after reconnects')
+    parser.add_argument('-n', '--messages', type=int, default=0, help='messages to send once the bot connects, 0 to only serve')
+    parser.add_argument('-r', '--rate', type=float, default=20.0, help='messages per second')
+    parser.add_argument('-c', '--channels', type=int, default=50)
+    parser.add_argument('-t', '--text', action='append', help='message text to send, may be repeated')
+    parser.add_argument('--timeout', type=float, default=30.0, help='seconds to wait for outstanding replies')
+    parser.add_argument('-o', '--output', help='write the JSON report to this path')
+    return parser.parse_args()
+
+
+async def main(args):
+    server = FakeSlackServer(
+        host=args.host,
+        port=args.port,
+        bot_name=args.bot_name,
+        users=args.users,
+        latency=args.latency,
+        jitter=args.jitter,
+        rate_limit=args.rate_limit,
+        retry_after=args.retry_after,
+        disconnect_every=args.disconnect_every,
+        redeliver=args.redeliver
+    )
+    await server.start()
+    logger.info(f"Point the bot at it with 'slack_api_url: {server.base_url}' in the core config section")
+    if not args.messages:
+        while True:
+            await asyncio.sleep(3600)
+    logger.info("Waiting for the bot to connect...")
+    await server.connected.wait()
+    generator = LoadGenerator(
+        server,
+        args.text or ['!help'],
+        messages=args.messages,
+        rate=args.rate,
+        channels=args.channels,
+        timeout=args.timeout
+    )
+    report = await generator.run()
+    await server.stop()
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    logger.build(_Config)
+    try:
+        asyncio.get_event_loop().run_until_complete(main(parse_args()))
+    except KeyboardInterrupt:
+        sys.exit(0)
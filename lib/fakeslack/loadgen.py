@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+import time
+import random
+import asyncio
+from collections import deque
+
+from ..metrics import percentile
+
+
+class LoadGenerator(object):
+
+    # Messages go out at a fixed rate over a pool of channels. Replies are
+    # matched to the oldest unanswered message in the same channel.
+
+    def __init__(self, server, texts, messages=1000, rate=20.0, channels=50, timeout=30.0, seed=0):
+        self.server = server
+        self.texts = texts
+        self.messages = messages
+        self.rate = rate
+        self.channels = [f"CLOAD{idx:04d}" for idx in range(channels)]
+        self.timeout = timeout
+        self.rand = random.Random(seed)
+        self.pending = {x: deque() for x in self.channels}
+        self.latencies = []
+        self.unmatched = 0
+        self.sent = 0
+        self.last_reply = None
+        server.on_post(self._on_reply)
+
+    def _on_reply(self, message):
+        queue = self.pending.get(message.get('channel'))
+        if not queue:
+            self.unmatched += 1
+            return
+        self.last_reply = time.perf_counter()
+        self.latencies.append(self.last_reply - queue.popleft())
+
+    async def run(self):
+        users = [x['id'] for x in self.server.users[1:]]
+        start = time.perf_counter()
+        for idx in range(self.messages):
+            await self.server.connected.wait()
+            due = start + idx / self.rate
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            channel = self.channels[idx % len(self.channels)]
+            self.pending[channel].append(time.perf_counter())
+            await self.server.send_message(channel, self.rand.choice(users), self.rand.choice(self.texts))
+            self.sent += 1
+        deadline = time.perf_counter() + self.timeout
+        while any(self.pending.values()) and time.perf_counter() < deadline:
+            await asyncio.sleep(0.1)
+        elapsed = (self.last_reply or time.perf_counter()) - start
+        return self.report(elapsed)
+
+    def report(self, elapsed):
+        latencies = sorted(self.latencies)
+        return {
+            "sent": self.sent,
+            "replies": len(latencies),
+            "lost": sum(len(x) for x in self.pending.values()),
+            "unmatched_replies": self.unmatched,
+            "elapsed_s": elapsed,
+            "replies_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "max_ms": latencies[-1] * 1000 if latencies else 0.0,
+            "api_calls": dict(self.server.counts),
+        }
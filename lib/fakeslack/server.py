@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+
+import json
+import time
+import random
+import asyncio
+import itertools
+
+from aiohttp import web, WSMsgType
+
+from ..logging import SlackBotLogger as logger
+
+
+class FakeSlackServer(object):
+
+    def __init__(self, host='127.0.0.1', port=8765, bot_name='slackbot', users=10,
+                 latency=0.0, jitter=0.0, rate_limit=0.0, retry_after=1, disconnect_every=0, redeliver=0.0):
+        self.host = host
+        self.port = port
+        self.bot_id = 'UBOT'
+        self.bot_name = bot_name
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.disconnect_every = disconnect_every
+        self.redeliver = redeliver
+        self.users = [self._user(self.bot_id, bot_name)]
+        self.users += [self._user(f"U{idx:05d}", f"user{idx}") for idx in range(users)]
+        self.sockets = set()
+        self.listeners = []
+        self.ts = itertools.count(1)
+        self.counts = {}
+        self.connected = asyncio.Event()
+        self.app = web.Application(client_max_size=1024 ** 3)
+        self.app.router.add_route('*', '/api/{method}', self.handle_api)
+        self.app.router.add_get('/rtm', self.handle_rtm)
+        self.runner = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}/api/"
+
+    def _user(self, user_id, name):
+        return {
+            "id": user_id,
+            "name": name,
+            "real_name": name,
+            "profile": {"display_name": name, "real_name": name}
+        }
+
+    def _next_ts(self):
+        return "%d.%06d" % (int(time.time()), next(self.ts) % 1000000)
+
+    def _count(self, key):
+        self.counts[key] = self.counts.get(key, 0) + 1
+
+    async def start(self):
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+        if self.disconnect_every:
+            asyncio.ensure_future(self._disconnect_loop())
+        logger.info(f"Fake slack api listening on {self.base_url}")
+
+    async def stop(self):
+        for ws in list(self.sockets):
+            await ws.close()
+        if self.runner:
+            await self.runner.cleanup()
+
+    def on_post(self, f):
+        self.listeners.append(f)
+        return f
+
+    async def _params(self, request):
+        params = dict(request.query)
+        if request.method != 'POST':
+            return params
+        if request.content_type == 'application/json':
+            body = await request.text()
+            if body.strip():
+                params.update(json.loads(body))
+        elif request.content_type == 'multipart/form-data':
+            reader = await request.multipart()
+            async for part in reader:
+                if part.filename:
+                    size = 0
+                    while True:
+                        chunk = await part.read_chunk()
+                        if not chunk:
+                            break
+                        size += len(chunk)
+                    params[part.name] = {'filename': part.filename, 'size': size}
+                else:
+                    params[part.name] = await part.text()
+        else:
+            params.update(await request.post())
+        return params
+
+    async def handle_api(self, request):
+        method = request.match_info['method']
+        self._count(method)
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + random.random() * self.jitter)
+        if self.rate_limit and random.random() < self.rate_limit:
+            self._count('ratelimited')
+            return web.json_response(
+                {"ok": False, "error": "ratelimited"},
+                status=429,
+                headers={"Retry-After": str(self.retry_after)}
+            )
+        params = await self._params(request)
+        handler = getattr(self, 'api_' + method.replace('.', '_'), None)
+        if handler is None:
+            return web.json_response({"ok": True})
+        return web.json_response(await handler(request, params))
+
+    async def api_rtm_connect(self, request, params):
+        return {
+            "ok": True,
+            "url": f"ws://{self.host}:{self.port}/rtm",
+            "self": {"id": self.bot_id, "name": self.bot_name},
+            "team": {"id": "TFAKE", "name": "fake", "domain": "fake"}
+        }
+
+    api_rtm_start = api_rtm_connect
+
+    async def api_users_list(self, request, params):
+        return {"ok": True, "members": self.users}
+
+    async def api_chat_postMessage(self, request, params):
+        message = {
+            "type": "message",
+            "user": self.bot_id,
+            "channel": params.get('channel'),
+            "text": params.get('text') or '',
+            "attachments": params.get('attachments'),
+            "ts": self._next_ts()
+        }
+        for func in self.listeners:
+            func(message)
+        return {"ok": True, "channel": message['channel'], "ts": message['ts'], "message": message}
+
+    api_chat_meMessage = api_chat_postMessage
+
+    async def api_files_upload(self, request, params):
+        upload = params.get('file') or {}
+        message = {
+            "type": "file",
+            "user": self.bot_id,
+            "channel": params.get('channels'),
+            "text": params.get('title') or '',
+            "size": upload.get('size', len(params.get('content') or '')),
+            "ts": self._next_ts()
+        }
+        for func in self.listeners:
+            func(message)
+        return {"ok": True, "file": {"id": "FFAKE", "title": message['text'], "size": message['size']}}
+
+    async def handle_rtm(self, request):
+        ws = web.WebSocketResponse(autoping=True)
+        await ws.prepare(request)
+        self._count('rtm.websocket')
+        self.sockets.add(ws)
+        await ws.send_str(json.dumps({"type": "hello"}))
+        self.connected.set()
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                data = json.loads(msg.data)
+                if data.get('type') == 'ping':
+                    await ws.send_str(json.dumps({"type": "pong", "reply_to": data.get('id')}))
+        finally:
+            self.sockets.discard(ws)
+            if not self.sockets:
+                self.connected.clear()
+        return ws
+
+    async def _disconnect_loop(self):
+        while True:
+            await asyncio.sleep(self.disconnect_every)
+            if self.sockets:
+                logger.info("Injecting rtm disconnect")
+                self._count('disconnects')
+            for ws in list(self.sockets):
+                await ws.close()
+
+    async def send_message(self, channel, user, text):
+        event = {
+            "type": "message",
+            "channel": channel,
+            "user": user,
+            "text": text,
+            "ts": self._next_ts(),
+            "client_msg_id": "%032x" % random.getrandbits(128)
+        }
+        data = json.dumps(event)
+        copies = 2 if random.random() < self.redeliver else 1
+        for _ in range(copies):
+            for ws in list(self.sockets):
+                await ws.send_str(data)
+        return event
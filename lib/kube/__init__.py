@@ -0,0 +1,7 @@
+#!/usr/bin/env python3
+
+from .config import ClusterConfig, load_kubeconfig
+from .client import KubeClient, KubeAPIError
+from .informer import Informer, ResourceCache, Store
+from .fanout import FanOut, FanOutResult
+from .resources import RESOURCES
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+import json
+import socket
+import threading
+import urllib.parse
+import urllib.request
+import urllib.error
+
+
+class KubeAPIError(Exception):
+
+    def __init__(self, status, message):
+        super().__init__(f"{status}: {message}")
+        self.status = status
+
+
+class KubeClient(object):
+
+    def __init__(self, cluster, timeout=10):
+        self.cluster = cluster
+        self.timeout = timeout
+        self.ssl_context = cluster.ssl_context()
+        self.headers = cluster.headers()
+        # Open watch streams, so close can interrupt their blocking reads
+        self.lock = threading.Lock()
+        self.watches = set()
+
+    def _open(self, path, params, timeout):
+        url = f"{self.cluster.server}{path}"
+        if params:
+            url += '?' + urllib.parse.urlencode(params)
+        request = urllib.request.Request(url, headers=dict(self.headers, Accept='application/json'))
+        try:
+            return urllib.request.urlopen(request, timeout=timeout, context=self.ssl_context)
+        except urllib.error.HTTPError as err:
+            raise KubeAPIError(err.code, err.read().decode(errors='replace')[:200])
+
+    def list(self, path, summarize, max_items=None, selector=None, limit=500, timeout=None):
+        # Follows continue tokens so large lists come in pages. Each page is
+        # summarized as soon as it is decoded, only max_items summaries are
+        # kept and the rest are just counted. Returns the summaries, the
+        # resourceVersion to watch from and how many objects there were
+        items = []
+        total = 0
+        params = {'limit': limit}
+        if selector:
+            params['labelSelector'] = selector
+        while True:
+            with self._open(path, params, timeout or self.timeout) as response:
+                body = json.load(response)
+            page = body.pop('items', None) or []
+            total += len(page)
+            room = len(page) if max_items is None else max(0, max_items - len(items))
+            items.extend(summarize(x) for x in page[:room])
+            del page
+            metadata = body.get('metadata') or {}
+            if not metadata.get('continue'):
+                return items, metadata.get('resourceVersion'), total
+            params['continue'] = metadata['continue']
+
+    def watch(self, path, resource_version, timeout_seconds=300):
+        params = {
+            'watch': 'true',
+            'resourceVersion': resource_version,
+            'timeoutSeconds': timeout_seconds,
+            'allowWatchBookmarks': 'true'
+        }
+        # The server ends the stream after timeoutSeconds, give it a margin
+        with self._open(path, params, timeout_seconds + 30) as response:
+            with self.lock:
+                self.watches.add(response)
+            try:
+                for line in response:
+                    if line.strip():
+                        event = json.loads(line)
+                        if event.get('type') == 'ERROR':
+                            status = event.get('object') or {}
+                            raise KubeAPIError(status.get('code'), status.get('message'))
+                        yield event['type'], event['object']
+            finally:
+                with self.lock:
+                    self.watches.discard(response)
+
+    def close(self):
+        # Closing the response would wait for the reader, shutting the socket
+        # down wakes it up with an EOF straight away
+        with self.lock:
+            watches = list(self.watches)
+        for response in watches:
+            sock = getattr(getattr(response.fp, 'raw', None), '_sock', None)
+            if sock is None:
+                continue
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
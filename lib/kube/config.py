@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+import os
+import ssl
+import base64
+import tempfile
+
+import yaml
+
+
+def default_kubeconfig_path():
+    return os.environ.get('KUBECONFIG', '').split(os.pathsep)[0] or \
+        os.path.expanduser('~/.kube/config')
+
+
+def _named(items, name):
+    for item in items or []:
+        if item.get('name') == name:
+            return item
+    return None
+
+
+def _data_or_file(opts, key, base_dir):
+    if opts.get(f"{key}-data"):
+        return base64.b64decode(opts[f"{key}-data"])
+    if opts.get(key):
+        with open(os.path.join(base_dir, opts[key]), 'rb') as f:
+            return f.read()
+    return None
+
+
+class ClusterConfig(object):
+
+    def __init__(self, name, server, namespace='default', token=None, username=None,
+                 password=None, ca_data=None, cert_data=None, key_data=None, insecure=False):
+        self.name = name
+        self.server = server.rstrip('/')
+        self.namespace = namespace
+        self.token = token
+        self.username = username
+        self.password = password
+        self.ca_data = ca_data
+        self.cert_data = cert_data
+        self.key_data = key_data
+        self.insecure = insecure
+
+    def ssl_context(self):
+        if not self.server.startswith('https'):
+            return None
+        context = ssl.create_default_context()
+        if self.insecure:
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        elif self.ca_data:
+            context.load_verify_locations(cadata=self.ca_data.decode())
+        if self.cert_data and self.key_data:
+            # load_cert_chain only takes paths
+            with tempfile.TemporaryDirectory() as tmp:
+                cert_path = os.path.join(tmp, 'cert.pem')
+                key_path = os.path.join(tmp, 'key.pem')
+                for path, data in [(cert_path, self.cert_data), (key_path, self.key_data)]:
+                    with open(os.open(path, os.O_WRONLY | os.O_CREAT, 0o600), 'wb') as f:
+                        f.write(data)
+                context.load_cert_chain(cert_path, key_path)
+        return context
+
+    def headers(self):
+        if self.token:
+            return {"Authorization": f"Bearer {self.token}"}
+        if self.username:
+            creds = base64.b64encode(f"{self.username}:{self.password or ''}".encode()).decode()
+            return {"Authorization": f"Basic {creds}"}
+        return {}
+
+
+def load_kubeconfig(path=None, contexts=None):
+    # Returns a ClusterConfig per requested context name, or just the
+    # current-context when none are given. 'all' loads every context
+    path = path or default_kubeconfig_path()
+    base_dir = os.path.dirname(os.path.abspath(path))
+    with open(path, 'r') as f:
+        data = yaml.safe_load(f.read()) or {}
+    if contexts == 'all':
+        contexts = [x.get('name') for x in data.get('contexts') or []]
+    elif not contexts:
+        contexts = [data.get('current-context')]
+    out = []
+    for name in contexts:
+        ctx = _named(data.get('contexts'), name)
+        if not ctx:
+            raise ValueError(f"Context {name} not found in {path}")
+        ctx = ctx.get('context') or {}
+        cluster = (_named(data.get('clusters'), ctx.get('cluster')) or {}).get('cluster') or {}
+        user = (_named(data.get('users'), ctx.get('user')) or {}).get('user') or {}
+        if not cluster.get('server'):
+            raise ValueError(f"Context {name} has no cluster server")
+        token = user.get('token')
+        if not token and user.get('tokenFile'):
+            with open(os.path.join(base_dir, user['tokenFile']), 'r') as f:
+                token = f.read().strip()
+        out.append(ClusterConfig(
+            name,
+            cluster['server'],
+            namespace=ctx.get('namespace') or 'default',
+            token=token,
+            username=user.get('username'),
+            password=user.get('password'),
+            ca_data=_data_or_file(cluster, 'certificate-authority', base_dir),
+            cert_data=_data_or_file(user, 'client-certificate', base_dir),
+            key_data=_data_or_file(user, 'client-key', base_dir),
+            insecure=cluster.get('insecure-skip-tls-verify') is True
+        ))
+    return out
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import yaml
+
+
+PATHS = [
+    (re.compile(r'^/api/v1/namespaces$'), 'namespaces'),
+    (re.compile(r'^/api/v1/(?:namespaces/(?P<ns>[^/]+)/)?pods$'), 'pods'),
+    (re.compile(r'^/api/v1/(?:namespaces/(?P<ns>[^/]+)/)?services$'), 'services'),
+    (re.compile(r'^/apis/apps/v1/(?:namespaces/(?P<ns>[^/]+)/)?deployments$'), 'deployments'),
+]
+
+
+class FakeKubeServer(object):
+    # Enough of the Kubernetes API to list and watch pods, deployments,
+    # services and namespaces. Changes go through add/modify/delete and are
+    # fanned out to open watches
+
+    def __init__(self, host='127.0.0.1', port=0, name='fake', token='fake-token',
+                 latency=0.0, history=1000):
+        self.name = name
+        self.token = token
+        self.latency = latency
+        self.objects = {kind: {} for _, kind in PATHS}
+        self.events = deque(maxlen=history)
+        self.resource_version = 0
+        self.cond = threading.Condition()
+        self.stopped = False
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _record(self, event_type, kind, obj):
+        with self.cond:
+            self.resource_version += 1
+            obj['metadata']['resourceVersion'] = str(self.resource_version)
+            key = (obj['metadata'].get('namespace'), obj['metadata']['name'])
+            if event_type == 'DELETED':
+                self.objects[kind].pop(key, None)
+            else:
+                self.objects[kind][key] = obj
+            self.events.append((self.resource_version, kind, event_type, json.dumps(obj)))
+            self.cond.notify_all()
+
+    def add(self, kind, obj):
+        obj.setdefault('metadata', {}).setdefault(
+            'creationTimestamp', datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        )
+        self._record('ADDED', kind, obj)
+
+    def modify(self, kind, obj):
+        self._record('MODIFIED', kind, obj)
+
+    def delete(self, kind, namespace, name):
+        obj = self.objects[kind].get((namespace, name))
+        if obj:
+            self._record('DELETED', kind, obj)
+
+    def seed(self, namespaces=3, deployments=5, replicas=3):
+        for ns_idx in range(namespaces):
+            ns = f"ns{ns_idx}"
+            self.add('namespaces', {'metadata': {'name': ns}, 'status': {'phase': 'Active'}})
+            for idx in range(deployments):
+                app = f"app{idx}"
+                labels = {'app': app}
+                self.add('deployments', fake_deployment(ns, app, replicas, labels))
+                self.add('services', fake_service(ns, app, labels))
+                for replica in range(replicas):
+                    self.add('pods', fake_pod(ns, f"{app}-{replica:05d}", labels))
+
+    def write_kubeconfig(self, path, context=None):
+        context = context or self.name
+        data = {
+            'apiVersion': 'v1',
+            'kind': 'Config',
+            'current-context': context,
+            'clusters': [{'name': context, 'cluster': {'server': self.url}}],
+            'users': [{'name': context, 'user': {'token': self.token}}],
+            'contexts': [{'name': context, 'context': {'cluster': context, 'user': context}}],
+        }
+        with open(path, 'w') as f:
+            yaml.safe_dump(data, f)
+
+    def _list(self, kind, namespace, params):
+        with self.cond:
+            # Equality selectors only, like the cache
+            selector = [x.split('=', 1) for x in params.get('labelSelector', [''])[0].split(',') if x]
+            items = [
+                obj for (ns, _), obj in sorted(self.objects[kind].items(), key=lambda x: (x[0][0] or '', x[0][1]))
+                if (not namespace or ns == namespace)
+                and all((obj['metadata'].get('labels') or {}).get(k) == v for k, v in selector)
+            ]
+            resource_version = self.resource_version
+        limit = int(params.get('limit', [0])[0] or 0)
+        start = int(params.get('continue', [0])[0] or 0)
+        metadata = {'resourceVersion': str(resource_version)}
+        if limit:
+            if start + limit < len(items):
+                metadata['continue'] = str(start + limit)
+            items = items[start:start + limit]
+        return {'kind': 'List', 'metadata': metadata, 'items': items}
+
+    def _watch(self, write, kind, namespace, params):
+        since = int(params.get('resourceVersion', [0])[0] or 0)
+        deadline = time.monotonic() + int(params.get('timeoutSeconds', [300])[0])
+        while time.monotonic() < deadline:
+            with self.cond:
+                # The watcher fell behind the retained history
+                if self.events and since < self.events[0][0] - 1:
+                    expired = {'kind': 'Status', 'code': 410, 'reason': 'Expired', 'message': 'too old resource version'}
+                    write({'type': 'ERROR', 'object': expired})
+                    return
+                pending = [x for x in self.events if x[0] > since]
+                if not pending:
+                    self.cond.wait(max(0, min(1, deadline - time.monotonic())))
+                    if self.stopped:
+                        return
+                    continue
+            for resource_version, event_kind, event_type, data in pending:
+                since = resource_version
+                obj = json.loads(data)
+                if event_kind != kind or (namespace and obj['metadata'].get('namespace') != namespace):
+                    continue
+                write({'type': event_type, 'object': obj})
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = parse_qs(url.query)
+                if server.token and self.headers.get('Authorization') != f"Bearer {server.token}":
+                    return self._json(401, {'kind': 'Status', 'code': 401, 'message': 'Unauthorized'})
+                for regex, kind in PATHS:
+                    match = regex.match(url.path)
+                    if match:
+                        break
+                else:
+                    return self._json(404, {'kind': 'Status', 'code': 404, 'message': 'not found'})
+                namespace = match.groupdict().get('ns')
+                if params.get('watch', [''])[0] in ['true', '1']:
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'application/json')
+                    self.end_headers()
+
+                    def write(event):
+                        self.wfile.write(json.dumps(event).encode() + b'\n')
+                        self.wfile.flush()
+
+                    try:
+                        server._watch(write, kind, namespace, params)
+                    except (BrokenPipeError, ConnectionResetError):
+                        pass
+                    return
+                if server.latency:
+                    time.sleep(server.latency)
+                self._json(200, server._list(kind, namespace, params))
+
+            def _json(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+
+def fake_pod(namespace, name, labels, phase='Running', restarts=0):
+    return {
+        'metadata': {'name': name, 'namespace': namespace, 'labels': dict(labels)},
+        'spec': {'nodeName': 'node-1', 'containers': [{'name': 'main', 'image': f"{labels.get('app')}:latest"}]},
+        'status': {
+            'phase': phase,
+            'podIP': '10.0.%d.%d' % (random.randint(0, 255), random.randint(1, 254)),
+            'containerStatuses': [{'name': 'main', 'ready': phase == 'Running', 'restartCount': restarts}]
+        }
+    }
+
+
+def fake_deployment(namespace, name, replicas, labels):
+    return {
+        'metadata': {'name': name, 'namespace': namespace, 'labels': dict(labels)},
+        'spec': {
+            'replicas': replicas,
+            'selector': {'matchLabels': dict(labels)},
+            'template': {'spec': {'containers': [{'name': 'main', 'image': f"{name}:latest"}]}}
+        },
+        'status': {'readyReplicas': replicas, 'updatedReplicas': replicas, 'availableReplicas': replicas}
+    }
+
+
+def fake_service(namespace, name, labels):
+    return {
+        'metadata': {'name': name, 'namespace': namespace, 'labels': dict(labels)},
+        'spec': {
+            'type': 'ClusterIP',
+            'clusterIP': '10.96.%d.%d' % (random.randint(0, 255), random.randint(1, 254)),
+            'ports': [{'port': 80, 'protocol': 'TCP'}],
+            'selector': dict(labels)
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog='python -m lib.kube.fake',
+        description='Serve a fake Kubernetes API with synthetic workloads for the kubectl plugin'
+    )
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--name', default='fake', help='context name written to the kubeconfig')
+    parser.add_argument('--kubeconfig', default='fake-kubeconfig.yml', help='where to write a kubeconfig for this server')
+    parser.add_argument('--namespaces', type=int, default=3)
+    parser.add_argument('--deployments', type=int, default=5, help='deployments per namespace')
+    parser.add_argument('--replicas', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every list call')
+    parser.add_argument('--churn', type=float, default=0.0, help='seconds between pod restarts, 0 to disable')
+    args = parser.parse_args()
+
+    server = FakeKubeServer(args.host, args.port, name=args.name, latency=args.latency).start()
+    server.seed(args.namespaces, args.deployments, args.replicas)
+    server.write_kubeconfig(args.kubeconfig)
+    print(f"Serving fake kubernetes api on {server.url}, kubeconfig written to {args.kubeconfig}")
+    try:
+        while True:
+            if not args.churn:
+                time.sleep(3600)
+                continue
+            time.sleep(args.churn)
+            namespace, name = random.choice(list(server.objects['pods']))
+            pod = server.objects['pods'][(namespace, name)]
+            server.delete('pods', namespace, name)
+            server.add('pods', fake_pod(namespace, name, pod['metadata']['labels'], restarts=1))
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
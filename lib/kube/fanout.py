@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+import time
+import socket
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from ..metrics import SlackBotMetrics as metrics
+
+
+class FanOutResult(object):
+
+    def __init__(self):
+        self.results = {}
+        self.timed_out = []
+        self.errors = {}
+
+    @property
+    def partial(self):
+        return bool(self.timed_out or self.errors)
+
+
+class FanOut(object):
+    # Runs one query per cluster concurrently and collects whatever is done
+    # by the deadline. Stragglers keep their worker until the client
+    # timeout, so the pool is sized with headroom
+
+    def __init__(self, caches, deadline=3.0):
+        self.caches = caches
+        self.deadline = deadline
+        self.pool = ThreadPoolExecutor(max_workers=max(4, len(caches) * 2))
+
+    def _run(self, cache, fn, args):
+        start = time.perf_counter()
+        try:
+            return fn(cache, *args)
+        finally:
+            metrics.observe('slackbot_kube_fanout_seconds', time.perf_counter() - start, cluster=cache.name)
+
+    def query(self, fn, *args):
+        futures = {self.pool.submit(self._run, cache, fn, args): cache.name for cache in self.caches}
+        done, not_done = wait(futures, timeout=self.deadline)
+        out = FanOutResult()
+        for future in done:
+            name = futures[future]
+            try:
+                out.results[name] = future.result()
+            except Exception as err:
+                # A live list that hit the client timeout is a straggler too
+                if isinstance(err, socket.timeout) or isinstance(getattr(err, 'reason', None), socket.timeout):
+                    not_done.add(future)
+                    continue
+                out.errors[name] = err
+                metrics.inc('slackbot_kube_fanout_errors_total', cluster=name)
+        for future in not_done:
+            out.timed_out.append(futures[future])
+            metrics.inc('slackbot_kube_fanout_timeouts_total', cluster=futures[future])
+        return out
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False)
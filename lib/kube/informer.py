@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+
+import sys
+import random
+import threading
+
+from ..logging import SlackBotLogger as logger
+from ..metrics import SlackBotMetrics as metrics
+from .client import KubeClient, KubeAPIError
+from .resources import RESOURCES
+
+
+def parse_selector(selector):
+    # Equality based selectors only, e.g. "app=web,tier=frontend"
+    if not selector:
+        return []
+    out = []
+    for term in selector.split(','):
+        key, _, value = term.strip().partition('=')
+        out.append(f"{key.strip()}={value.lstrip('=').strip()}")
+    return out
+
+
+def matches(summary, selector):
+    labels = {f"{k}={v}" for k, v in (summary.get('labels') or {}).items()}
+    return all(term in labels for term in parse_selector(selector))
+
+
+class Store(object):
+    # Summaries keyed by (namespace, name) with secondary indexes by
+    # namespace and by label. Index entries are frozensets that writers
+    # swap out, so lookups only need the lock to copy the full listing
+
+    def __init__(self, max_objects=20000):
+        self.max_objects = max_objects
+        self.lock = threading.Lock()
+        self.objects = {}
+        self.by_namespace = {}
+        self.by_label = {}
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.objects)
+
+    def _index_keys(self, summary):
+        keys = [('ns', summary.get('namespace'))]
+        keys += [('label', f"{k}={v}") for k, v in summary.get('labels', {}).items()]
+        return keys
+
+    def _index_add(self, key, summary, by_namespace, by_label):
+        for kind, value in self._index_keys(summary):
+            index = by_namespace if kind == 'ns' else by_label
+            index[value] = index.get(value, frozenset()) | {key}
+
+    def _index_remove(self, key, summary):
+        for kind, value in self._index_keys(summary):
+            index = self.by_namespace if kind == 'ns' else self.by_label
+            remaining = index.get(value, frozenset()) - {key}
+            if remaining:
+                index[value] = remaining
+            else:
+                index.pop(value, None)
+
+    def replace(self, summaries, total=None):
+        # total is how many objects the list had, summaries may already
+        # have been cut down to max_objects
+        objects = {}
+        by_namespace = {}
+        by_label = {}
+        for summary in summaries[:self.max_objects]:
+            key = (summary.get('namespace'), summary['name'])
+            objects[key] = summary
+            self._index_add(key, summary, by_namespace, by_label)
+        with self.lock:
+            self.dropped = max(0, (len(summaries) if total is None else total) - self.max_objects)
+            self.objects = objects
+            self.by_namespace = by_namespace
+            self.by_label = by_label
+
+    def upsert(self, summary):
+        key = (summary.get('namespace'), summary['name'])
+        with self.lock:
+            old = self.objects.get(key)
+            if old is None and len(self.objects) >= self.max_objects:
+                self.dropped += 1
+                return False
+            if old is not None:
+                self._index_remove(key, old)
+            self.objects[key] = summary
+            self._index_add(key, summary, self.by_namespace, self.by_label)
+        return True
+
+    def delete(self, namespace, name):
+        key = (namespace, name)
+        with self.lock:
+            old = self.objects.pop(key, None)
+            if old is not None:
+                self._index_remove(key, old)
+
+    def get(self, namespace, name):
+        return self.objects.get((namespace, name))
+
+    def list(self, namespace=None, selector=None):
+        keys = None
+        if namespace:
+            keys = self.by_namespace.get(namespace, frozenset())
+        for term in parse_selector(selector):
+            matched = self.by_label.get(term, frozenset())
+            keys = matched if keys is None else keys & matched
+        if keys is None:
+            with self.lock:
+                found = list(self.objects.values())
+        else:
+            objects = self.objects
+            found = [objects[x] for x in keys if x in objects]
+        return sorted(found, key=lambda x: (x.get('namespace') or '', x['name']))
+
+
+class Informer(object):
+    # list then watch from the returned resourceVersion, relisting when the
+    # watch falls too far behind (410 Gone) or the connection drops
+
+    def __init__(self, client, resource, stop_event, max_objects=20000, watch_timeout=300):
+        self.client = client
+        self.resource = resource
+        self.stop_event = stop_event
+        self.store = Store(max_objects)
+        self.synced = threading.Event()
+        self.watch_timeout = watch_timeout
+        self.labels = {'cluster': client.cluster.name, 'resource': resource.name}
+
+    def run(self):
+        backoff = 1
+        while not self.stop_event.is_set():
+            try:
+                resource_version = self._list()
+                backoff = 1
+                while not self.stop_event.is_set():
+                    resource_version = self._watch(resource_version)
+            except KubeAPIError as err:
+                if err.status == 410:
+                    logger.debug(f"Watch expired for {self.labels}, relisting")
+                    metrics.inc('slackbot_kube_relists_total', reason='expired', **self.labels)
+                    continue
+                logger.error(f"Kubernetes API error for {self.labels}", err, sys.exc_info())
+            except Exception as err:
+                logger.debug(f"Watch for {self.labels} failed: {err}")
+            metrics.inc('slackbot_kube_relists_total', reason='error', **self.labels)
+            self.stop_event.wait(backoff + random.random())
+            backoff = min(backoff * 2, 60)
+
+    def _list(self):
+        summaries, resource_version, total = self.client.list(
+            self.resource.path,
+            self.resource.summarize,
+            max_items=self.store.max_objects
+        )
+        self.store.replace(summaries, total)
+        self._update_gauges()
+        self.synced.set()
+        return resource_version
+
+    def _watch(self, resource_version):
+        for event_type, obj in self.client.watch(self.resource.path, resource_version, self.watch_timeout):
+            if self.stop_event.is_set():
+                break
+            resource_version = (obj.get('metadata') or {}).get('resourceVersion') or resource_version
+            metrics.inc('slackbot_kube_watch_events_total', type=event_type, **self.labels)
+            if event_type in ['ADDED', 'MODIFIED']:
+                self.store.upsert(self.resource.summarize(obj))
+            elif event_type == 'DELETED':
+                meta = obj.get('metadata') or {}
+                self.store.delete(meta.get('namespace'), meta.get('name'))
+            else:
+                continue
+            self._update_gauges()
+        return resource_version
+
+    def _update_gauges(self):
+        metrics.set('slackbot_kube_cache_objects', len(self.store), **self.labels)
+        metrics.set('slackbot_kube_cache_dropped', self.store.dropped, **self.labels)
+
+
+class ResourceCache(object):
+
+    def __init__(self, cluster, resources=None, max_objects=20000, timeout=10):
+        self.cluster = cluster
+        self.name = cluster.name
+        self.client = KubeClient(cluster, timeout=timeout)
+        self.stop_event = threading.Event()
+        self.informers = {
+            name: Informer(self.client, RESOURCES[name], self.stop_event, max_objects)
+            for name in (resources or list(RESOURCES))
+        }
+
+    def start(self):
+        for name, informer in self.informers.items():
+            threading.Thread(target=informer.run, daemon=True).start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.client.close()
+
+    def has(self, resource):
+        return resource in self.informers
+
+    def synced(self, resource):
+        return self.informers[resource].synced.is_set()
+
+    def wait_synced(self, timeout=None):
+        return all(x.synced.wait(timeout) for x in self.informers.values())
+
+    def query(self, resource, namespace=None, name=None, selector=None, timeout=None):
+        # Served from the cache once synced, until then straight from the
+        # API so a cluster that is still starting can answer
+        if self.synced(resource):
+            if name:
+                found = [x for x in [self.get(resource, namespace, name)] if x]
+                return [x for x in found if matches(x, selector)]
+            return self.list(resource, namespace, selector)
+        definition = RESOURCES[resource]
+        found, _, _ = self.client.list(
+            definition.list_path(namespace),
+            definition.summarize,
+            max_items=self.informers[resource].store.max_objects,
+            selector=','.join(parse_selector(selector)),
+            timeout=timeout
+        )
+        if name:
+            found = [x for x in found if x['name'] == name]
+        return sorted(found, key=lambda x: (x.get('namespace') or '', x['name']))
+
+    def get(self, resource, namespace, name):
+        if not RESOURCES[resource].namespaced:
+            namespace = None
+        return self.informers[resource].store.get(namespace, name)
+
+    def list(self, resource, namespace=None, selector=None):
+        if not RESOURCES[resource].namespaced:
+            namespace = None
+        return self.informers[resource].store.list(namespace, selector)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+from datetime import datetime, timezone
+
+
+# The cache only keeps these trimmed summaries, full objects (managed
+# fields, annotations, specs) are dropped as soon as they are decoded
+
+def _meta(obj):
+    meta = obj.get('metadata') or {}
+    return {
+        'name': meta.get('name'),
+        'namespace': meta.get('namespace'),
+        'labels': meta.get('labels') or {},
+        'created': meta.get('creationTimestamp'),
+    }
+
+
+def summarize_pod(obj):
+    spec = obj.get('spec') or {}
+    status = obj.get('status') or {}
+    statuses = status.get('containerStatuses') or []
+    phase = status.get('phase')
+    for container in statuses:
+        waiting = (container.get('state') or {}).get('waiting')
+        if waiting and waiting.get('reason'):
+            phase = waiting['reason']
+    out = _meta(obj)
+    out.update({
+        'status': phase,
+        'ready': f"{sum(1 for x in statuses if x.get('ready'))}/{len(spec.get('containers') or [])}",
+        'restarts': sum(x.get('restartCount') or 0 for x in statuses),
+        'node': spec.get('nodeName'),
+        'ip': status.get('podIP'),
+        'images': [x.get('image') for x in spec.get('containers') or []],
+    })
+    return out
+
+
+def summarize_deployment(obj):
+    spec = obj.get('spec') or {}
+    status = obj.get('status') or {}
+    template = (spec.get('template') or {}).get('spec') or {}
+    out = _meta(obj)
+    out.update({
+        'ready': f"{status.get('readyReplicas') or 0}/{spec.get('replicas') or 0}",
+        'updated': status.get('updatedReplicas') or 0,
+        'available': status.get('availableReplicas') or 0,
+        'selector': (spec.get('selector') or {}).get('matchLabels') or {},
+        'images': [x.get('image') for x in template.get('containers') or []],
+    })
+    return out
+
+
+def summarize_service(obj):
+    spec = obj.get('spec') or {}
+    out = _meta(obj)
+    out.update({
+        'type': spec.get('type'),
+        'cluster_ip': spec.get('clusterIP'),
+        'ports': ','.join(
+            f"{x.get('port')}/{x.get('protocol') or 'TCP'}" for x in spec.get('ports') or []
+        ),
+        'selector': spec.get('selector') or {},
+    })
+    return out
+
+
+def summarize_namespace(obj):
+    out = _meta(obj)
+    out['status'] = (obj.get('status') or {}).get('phase')
+    return out
+
+
+def age(timestamp, now=None):
+    if not timestamp:
+        return '-'
+    created = datetime.strptime(timestamp, '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=timezone.utc)
+    seconds = int(((now or datetime.now(timezone.utc)) - created).total_seconds())
+    for unit, size in [('d', 86400), ('h', 3600), ('m', 60)]:
+        if seconds >= size:
+            return f"{seconds // size}{unit}"
+    return f"{max(seconds, 0)}s"
+
+
+class Resource(object):
+
+    def __init__(self, name, path, summarize, columns, namespaced=True):
+        self.name = name
+        self.path = path
+        self.summarize = summarize
+        self.columns = columns
+        self.namespaced = namespaced
+
+    def list_path(self, namespace=None):
+        if not self.namespaced or not namespace:
+            return self.path
+        base, kind = self.path.rsplit('/', 1)
+        return f"{base}/namespaces/{namespace}/{kind}"
+
+    def row(self, summary):
+        return [
+            age(summary.get('created')) if key == 'age' else summary.get(key)
+            for _, key in self.columns
+        ]
+
+
+RESOURCES = {
+    'pods': Resource('pods', '/api/v1/pods', summarize_pod, [
+        ('NAME', 'name'), ('READY', 'ready'), ('STATUS', 'status'), ('RESTARTS', 'restarts'), ('AGE', 'age')
+    ]),
+    'deployments': Resource('deployments', '/apis/apps/v1/deployments', summarize_deployment, [
+        ('NAME', 'name'), ('READY', 'ready'), ('UP-TO-DATE', 'updated'), ('AVAILABLE', 'available'), ('AGE', 'age')
+    ]),
+    'services': Resource('services', '/api/v1/services', summarize_service, [
+        ('NAME', 'name'), ('TYPE', 'type'), ('CLUSTER-IP', 'cluster_ip'), ('PORTS', 'ports'), ('AGE', 'age')
+    ]),
+    'namespaces': Resource('namespaces', '/api/v1/namespaces', summarize_namespace, [
+        ('NAME', 'name'), ('STATUS', 'status'), ('AGE', 'age')
+    ], namespaced=False),
+}
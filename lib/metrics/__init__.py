@@ -0,0 +1,4 @@
+#!/usr/bin/env python3
+
+from .metrics import SlackBotMetrics, percentile
+from .server import MetricsServer
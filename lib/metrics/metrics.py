@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+
+
+def percentile(values, q):
+    # Nearest-rank percentile of an already sorted list
+    if not values:
+        return 0.0
+    idx = min(len(values) - 1, max(0, int(round(q * len(values) + 0.5)) - 1))
+    return values[idx]
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    out = ','.join(
+        '%s="%s"' % (k, v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for k, v in pairs
+    )
+    return "{%s}" % out
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Histogram(object):
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        # Linear interpolation inside the bucket holding the q-th observation
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for idx, count in enumerate(self.counts):
+            upper = self.buckets[idx] if idx < len(self.buckets) else self.buckets[-1]
+            if count and seen + count >= rank:
+                return lower + (upper - lower) * ((rank - seen) / count)
+            seen += count
+            lower = upper
+        return self.buckets[-1]
+
+
+class SlackBotMetrics(object):
+
+    lock = threading.Lock()
+    families = {}
+    collectors = []
+
+    @classmethod
+    def _series(cls, name, kind, labels):
+        family = cls.families.get(name)
+        if family is None:
+            family = cls.families[name] = {'type': kind, 'help': '', 'series': {}}
+        return family['series'], _label_key(labels)
+
+    @classmethod
+    def describe(cls, name, kind, help_text):
+        with cls.lock:
+            family = cls.families.setdefault(name, {'type': kind, 'help': '', 'series': {}})
+            family['help'] = help_text
+
+    @classmethod
+    def inc(cls, name, value=1, **labels):
+        with cls.lock:
+            series, key = cls._series(name, 'counter', labels)
+            series[key] = series.get(key, 0) + value
+
+    @classmethod
+    def set(cls, name, value, **labels):
+        with cls.lock:
+            series, key = cls._series(name, 'gauge', labels)
+            series[key] = value
+
+    @classmethod
+    def observe(cls, name, value, **labels):
+        with cls.lock:
+            series, key = cls._series(name, 'histogram', labels)
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = Histogram()
+            hist.observe(value)
+
+    @classmethod
+    @contextmanager
+    def timer(cls, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            cls.observe(name, time.perf_counter() - start, **labels)
+
+    @classmethod
+    def register_collector(cls, f):
+        cls.collectors.append(f)
+        return f
+
+    @classmethod
+    def unregister_collector(cls, f):
+        if f in cls.collectors:
+            cls.collectors.remove(f)
+
+    @classmethod
+    def collect(cls):
+        for func in cls.collectors:
+            func(cls)
+
+    @classmethod
+    def get_histograms(cls, name):
+        with cls.lock:
+            family = cls.families.get(name)
+            if not family:
+                return {}
+            return {
+                key: (hist.count, hist.sum, hist.quantile(0.5), hist.quantile(0.95))
+                for key, hist in family['series'].items()
+            }
+
+    @classmethod
+    def get_values(cls, name):
+        with cls.lock:
+            family = cls.families.get(name)
+            if not family:
+                return {}
+            return dict(family['series'])
+
+    @classmethod
+    def render(cls):
+        cls.collect()
+        lines = []
+        with cls.lock:
+            for name in sorted(cls.families):
+                family = cls.families[name]
+                if family['help']:
+                    lines.append(f"# HELP {name} {family['help']}")
+                lines.append(f"# TYPE {name} {family['type']}")
+                for key, value in sorted(family['series'].items()):
+                    if family['type'] != 'histogram':
+                        lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+                        continue
+                    cumulative = 0
+                    for idx, bound in enumerate(list(value.buckets) + [float('inf')]):
+                        cumulative += value.counts[idx]
+                        le = (('le', _format_value(float(bound))),)
+                        lines.append(f"{name}_bucket{_format_labels(key, le)} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {_format_value(value.sum)}")
+                    lines.append(f"{name}_count{_format_labels(key)} {value.count}")
+        return '\n'.join(lines) + '\n'
+
+    @classmethod
+    def reset(cls):
+        with cls.lock:
+            cls.families.clear()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .metrics import SlackBotMetrics
+from ..config import SlackBotConfig as config
+from ..logging import SlackBotLogger as logger
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = SlackBotMetrics.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"metrics: {format % args}")
+
+
+class MetricsServer(object):
+
+    server = None
+
+    @classmethod
+    def start(cls):
+        if cls.server or config.get('enabled') is not True:
+            return None
+        host = config.get('host') or '127.0.0.1'
+        port = config.get('port') or 9102
+        cls.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+        return cls.server
+
+    @classmethod
+    def stop(cls):
+        if cls.server:
+            cls.server.shutdown()
+            cls.server.server_close()
+            cls.server = None
@@ -0,0 +1,4 @@
+#!/usr/bin/env python3
+
+from .profiler import Profiler
+from .memory import MemoryTracker
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+
+import os
+import gc
+import time
+import threading
+import tracemalloc
+from collections import deque
+
+from ..logging import SlackBotLogger as logger
+
+
+CONTAINERS = (list, dict, set, frozenset, tuple, deque)
+# Plugin declarations, not state
+DECLARED = ['hooks', 'help_pages', 'trigger_phrases', 'trigger_regexes']
+
+
+ROOT = os.path.realpath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+
+def owner(filename):
+    # plugins/<name>/... is charged to that plugin and lib/<pkg>/... to the
+    # bot itself, None for anything outside the repo
+    if not filename.startswith(ROOT + os.sep):
+        return None
+    parts = os.path.relpath(filename, ROOT).split(os.sep)
+    if len(parts) > 2 and parts[0] == 'plugins':
+        return parts[1]
+    if len(parts) > 2 and parts[0] == 'lib':
+        return f"lib.{parts[1]}"
+    return parts[0]
+
+
+def library(filename):
+    parts = filename.split(os.sep)
+    if 'site-packages' in parts[:-1]:
+        return parts[parts.index('site-packages') + 1].split('.')[0]
+    return 'python'
+
+
+def rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def fmt_bytes(size, signed=False):
+    sign = ('-' if size < 0 else '+') if signed else ''
+    size = abs(size)
+    for unit in ['B', 'KiB', 'MiB']:
+        if size < 1024:
+            return f"{sign}{size:.0f}{unit}" if unit == 'B' else f"{sign}{size:.1f}{unit}"
+        size /= 1024.0
+    return f"{sign}{size:.1f}GiB"
+
+
+class MemoryTracker(object):
+
+    def __init__(self, client):
+        self.client = client
+        self.lock = threading.Lock()
+        self.baseline = None
+        self.previous = None
+        self.started = None
+
+    def tracing(self):
+        # Only a trace this tracker started, the startup report runs its
+        # own and stops it when plugins are set up
+        return self.baseline is not None and tracemalloc.is_tracing()
+
+    def start(self, frames=10):
+        with self.lock:
+            if self.baseline is not None or tracemalloc.is_tracing():
+                return False
+            tracemalloc.start(frames)
+            self.baseline = self.previous = self._snapshot()
+            self.started = time.monotonic()
+        logger.info(f"Started tracing allocations ({frames} frames)")
+        return True
+
+    def stop(self):
+        with self.lock:
+            if self.baseline is None:
+                return False
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            self.baseline = self.previous = None
+        return True
+
+    def _snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+        ])
+
+    def _site(self, traceback):
+        # The innermost frame inside the repo decides who is charged for the
+        # allocation, otherwise the library that made it
+        for frame in reversed(traceback):
+            name = owner(frame.filename)
+            if name:
+                return name, frame
+        return library(traceback[-1].filename), traceback[-1]
+
+    def diff(self, limit=10):
+        # Compares against both the previous diff and the baseline, sites
+        # that keep growing on every call are the likely leaks
+        with self.lock:
+            if not self.tracing():
+                return None
+            current = self._snapshot()
+            since_last = current.compare_to(self.previous, 'traceback')
+            since_start = {
+                stat.traceback: stat.size_diff
+                for stat in current.compare_to(self.baseline, 'traceback')
+            }
+            self.previous = current
+        by_owner = {}
+        for stat in since_last:
+            name, _ = self._site(stat.traceback)
+            size, count = by_owner.get(name, (0, 0))
+            by_owner[name] = (size + stat.size_diff, count + stat.count_diff)
+        sites = []
+        for stat in sorted(since_last, key=lambda x: x.size_diff, reverse=True)[:limit]:
+            name, frame = self._site(stat.traceback)
+            sites.append({
+                'owner': name,
+                'site': f"{'/'.join(frame.filename.split('/')[-2:])}:{frame.lineno}",
+                'size_diff': stat.size_diff,
+                'count_diff': stat.count_diff,
+                'total_diff': since_start.get(stat.traceback, stat.size_diff),
+            })
+        traced, peak = tracemalloc.get_traced_memory()
+        return {
+            'owners': sorted(by_owner.items(), key=lambda x: x[1][0], reverse=True),
+            'sites': sites,
+            'traced': traced,
+            'peak': peak,
+        }
+
+    def counts(self):
+        client = self.client
+        out = {
+            'users': len(getattr(client, 'users', None) or []),
+            'contexts': len(client.contexts.snapshot()),
+            'gc objects': len(gc.get_objects()),
+        }
+        kv = client.db.stats()
+        out['kv subjects'] = len(kv)
+        out['kv keys'] = sum(kv.values())
+        if getattr(client, 'seen_messages', None) is not None:
+            out['dedup entries'] = len(client.seen_messages)
+        # Any container held directly by a plugin, e.g. aws_news.announced
+        for name, plugin in client.plugins.hook_manager.registered_plugins.items():
+            for attr, value in vars(plugin).items():
+                if attr not in DECLARED and isinstance(value, CONTAINERS) and len(value):
+                    out[f"{name}.{attr}"] = len(value)
+        return out
+
+    def status(self):
+        lines = [f"RSS {fmt_bytes(rss_bytes())}"]
+        if self.tracing():
+            traced, peak = tracemalloc.get_traced_memory()
+            lines[0] += f", traced {fmt_bytes(traced)} (peak {fmt_bytes(peak)})"
+            lines[0] += f", tracing for {time.monotonic() - self.started:.0f}s"
+        counts = self.counts()
+        width = max(len(x) for x in counts)
+        lines += [f"{key:<{width}} {value:>10,}" for key, value in counts.items()]
+        return '\n'.join(lines)
+
+    def report(self, limit=10):
+        result = self.diff(limit)
+        if result is None:
+            return None
+        lines = [f"traced {fmt_bytes(result['traced'])}, peak {fmt_bytes(result['peak'])}", "", "by owner since last snapshot:"]
+        for name, (size, count) in result['owners'][:limit]:
+            lines.append(f"  {name:<24} {fmt_bytes(size, True):>10} {count:>+9,} blocks")
+        lines += ["", "top sites (since last / since start):"]
+        for site in result['sites']:
+            lines.append(
+                f"  {fmt_bytes(site['size_diff'], True):>10} {fmt_bytes(site['total_diff'], True):>10}  "
+                f"{site['owner']:<16} {site['site']}"
+            )
+        return '\n'.join(lines)
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import sys
+import time
+import pstats
+import cProfile
+import threading
+from datetime import datetime
+
+from ..config import SlackBotConfig as config
+from ..logging import SlackBotLogger as logger
+
+
+MODES = ['deterministic', 'sampling']
+
+
+class Profiler(object):
+
+    def __init__(self, client):
+        self.client = client
+        # Checked on every message, everything else only matters while profiling
+        self.active = False
+        self.lock = threading.Lock()
+        self.run_lock = threading.Lock()
+        self.timer = None
+        self.sampler = None
+
+    def start(self, channel, mode='deterministic', messages=None, seconds=None, interval=0.005):
+        with self.lock:
+            if self.active:
+                return False
+            self.channel = channel
+            self.mode = mode
+            self.max_messages = messages
+            self.messages = 0
+            self.started = time.monotonic()
+            self.profiles = []
+            self.unprofiled = 0
+            self.threads = set()
+            self.samples = {}
+            self.interval = interval
+            self.active = True
+        if mode == 'sampling':
+            self.sampler = threading.Thread(target=self._sample, daemon=True)
+            self.sampler.start()
+        if seconds:
+            self.timer = threading.Timer(seconds, self.stop)
+            self.timer.daemon = True
+            self.timer.start()
+        logger.info(f"Started {mode} profiling (messages: {messages}, seconds: {seconds})")
+        return True
+
+    def stop(self):
+        with self.lock:
+            if not self.active:
+                return False
+            self.active = False
+            if self.timer:
+                self.timer.cancel()
+                self.timer = None
+        if self.sampler:
+            self.sampler.join()
+            self.sampler = None
+        try:
+            summary, path = self._report()
+            self.client.send_channel_message(
+                self.channel,
+                f"Profiling finished, full profile written to `{path}`\n```\n{summary}\n```"
+            )
+        except Exception as err:
+            logger.error("Failed to write profile report", err, sys.exc_info())
+        return True
+
+    def status(self):
+        if not self.active:
+            return "Profiling is not running"
+        elapsed = time.monotonic() - self.started
+        return f"{self.mode} profiling running for {elapsed:.1f}s, {self.messages} messages profiled"
+
+    def run(self, kind, function, *args):
+        if self.mode == 'sampling':
+            ident = threading.get_ident()
+            self.threads.add(ident)
+            try:
+                return function(*args)
+            finally:
+                self.threads.discard(ident)
+                self._count(kind)
+        # Only one cProfile profiler may be enabled at a time on newer
+        # interpreters. Calls on other threads while one is being profiled
+        # run as normal instead of waiting for it
+        if not self.run_lock.acquire(blocking=False):
+            with self.lock:
+                self.unprofiled += 1
+            return function(*args)
+        try:
+            if not self.active:
+                return function(*args)
+            profile = cProfile.Profile()
+            try:
+                return profile.runcall(function, *args)
+            finally:
+                self.profiles.append(profile)
+                self._count(kind)
+        finally:
+            self.run_lock.release()
+
+    def _count(self, kind):
+        if kind != 'message':
+            return
+        with self.lock:
+            self.messages += 1
+            done = self.max_messages and self.messages >= self.max_messages
+        if done:
+            threading.Thread(target=self.stop, daemon=True).start()
+
+    def _sample(self):
+        me = threading.get_ident()
+        while self.active:
+            frames = sys._current_frames()
+            for ident in list(self.threads):
+                if ident == me or ident not in frames:
+                    continue
+                stack = []
+                frame = frames[ident]
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                    frame = frame.f_back
+                key = ';'.join(reversed(stack))
+                self.samples[key] = self.samples.get(key, 0) + 1
+            del frames
+            time.sleep(self.interval)
+
+    def _output_path(self, extension):
+        profile_dir = config.get('profile_dir') or os.path.join(os.getcwd(), 'profiles')
+        os.makedirs(profile_dir, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        return os.path.join(profile_dir, f"profile-{self.mode}-{stamp}.{extension}")
+
+    def _report(self, limit=20):
+        if self.mode == 'sampling':
+            return self._sampling_report(limit)
+        return self._deterministic_report(limit)
+
+    def _deterministic_report(self, limit):
+        path = self._output_path('prof')
+        if not self.profiles:
+            return "No calls were profiled", path
+        stats = pstats.Stats(self.profiles[0])
+        for profile in self.profiles[1:]:
+            stats.add(profile)
+        stats.dump_stats(path)
+        out = io.StringIO()
+        stats.stream = out
+        stats.strip_dirs().sort_stats('cumulative').print_stats(limit)
+        # Drop the pstats preamble, the table starts at the column header
+        lines = out.getvalue().splitlines()
+        start = next((i for i, x in enumerate(lines) if 'ncalls' in x), 0)
+        header = f"{self.messages} messages, {len(self.profiles)} profiled calls, " \
+            f"{self.unprofiled} calls ran unprofiled alongside them"
+        return '\n'.join([header] + [x for x in lines[start:] if x.strip()]), path
+
+    def _sampling_report(self, limit):
+        path = self._output_path('folded')
+        samples = dict(self.samples)
+        with open(path, 'w') as f:
+            for stack, count in sorted(samples.items()):
+                f.write(f"{stack} {count}\n")
+        total = sum(samples.values())
+        if not total:
+            return "No samples were taken", path
+        own = {}
+        inclusive = {}
+        for stack, count in samples.items():
+            frames = stack.split(';')
+            func = frames[-1].rsplit(':', 1)[0]
+            own[func] = own.get(func, 0) + count
+            for func in set(x.rsplit(':', 1)[0] for x in frames):
+                inclusive[func] = inclusive.get(func, 0) + count
+        lines = [
+            f"{self.messages} messages, {total} samples every {self.interval * 1000:.1f}ms",
+            "%7s %7s  %s" % ('self%', 'total%', 'function')
+        ]
+        for func, count in sorted(own.items(), key=lambda x: x[1], reverse=True)[:limit]:
+            lines.append("%6.1f%% %6.1f%%  %s" % (
+                count * 100.0 / total, inclusive[func] * 100.0 / total, func
+            ))
+        return '\n'.join(lines), path
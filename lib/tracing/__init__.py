@@ -0,0 +1,4 @@
+#!/usr/bin/env python3
+
+from .tracer import SlackBotTracer, Span
+from .exporter import JSONLExporter
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import argparse
+from collections import defaultdict
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        prog='python -m lib.tracing',
+        description='Summarize the slowest message traces in a JSONL trace export'
+    )
+    parser.add_argument('path', nargs='?', default='traces.jsonl', help='trace export, rotated backups are read too')
+    parser.add_argument('-n', '--top', type=int, default=10, help='number of traces to show')
+    parser.add_argument('--path-filter', dest='dispatch', help='only traces whose dispatch path matches (cmd, trigger, ...)')
+    return parser.parse_args()
+
+
+def load_spans(path):
+    paths = [path] + [f"{path}.{idx}" for idx in range(1, 100) if os.path.exists(f"{path}.{idx}")]
+    traces = defaultdict(list)
+    for name in paths:
+        if not os.path.exists(name):
+            continue
+        with open(name) as f:
+            for line in f:
+                try:
+                    span = json.loads(line)
+                except ValueError:
+                    continue
+                traces[span['trace_id']].append(span)
+    return traces
+
+
+def self_times(spans):
+    children = defaultdict(float)
+    for span in spans:
+        if span['parent_id']:
+            children[span['parent_id']] += span['duration']
+    return {span['span_id']: max(0.0, span['duration'] - children[span['span_id']]) for span in spans}
+
+
+def render(root, spans, depth=0):
+    attrs = ' '.join(f"{k}={v}" for k, v in root['attrs'].items())
+    error = f" !! {root['error']}" if root.get('error') else ''
+    lines = [f"{'  ' * depth}{root['name']:<{28 - 2 * depth}} {root['duration'] * 1000:9.2f}ms  {attrs}{error}"]
+    for child in sorted((x for x in spans if x['parent_id'] == root['span_id']), key=lambda x: x['start']):
+        lines += render(child, spans, depth + 1)
+    return lines
+
+
+def main():
+    args = parse_args()
+    traces = load_spans(args.path)
+    roots = []
+    for spans in traces.values():
+        root = next((x for x in spans if x['parent_id'] is None), None)
+        if root and (not args.dispatch or root['attrs'].get('path') == args.dispatch):
+            roots.append((root, spans))
+    if not roots:
+        print(f"No traces found in {args.path}")
+        return
+    roots.sort(key=lambda x: x[0]['duration'], reverse=True)
+    slowest = roots[:args.top]
+
+    # Where the time went in the slowest traces, by span name
+    totals = defaultdict(float)
+    for root, spans in slowest:
+        times = self_times(spans)
+        for span in spans:
+            totals[span['name']] += times[span['span_id']]
+    grand = sum(totals.values()) or 1.0
+    print(f"{len(roots)} traces, showing the {len(slowest)} slowest\n")
+    print("Self time by stage:")
+    for name, total in sorted(totals.items(), key=lambda x: x[1], reverse=True):
+        print(f"  {name:<26} {total * 1000:9.2f}ms  {total / grand:6.1%}")
+    for root, spans in slowest:
+        print(f"\ntrace {root['trace_id']}")
+        print('\n'.join(render(root, spans, 1)))
+
+
+if __name__ == '__main__':
+    main()
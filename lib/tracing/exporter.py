@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import queue
+import threading
+
+from ..logging import SlackBotLogger as logger
+
+
+class JSONLExporter(object):
+    # One span per line. The file is rotated to path.1 .. path.<backups>
+    # once it grows past max_bytes
+
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, backups=3, queue_size=1000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = None
+        self.file = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=5):
+        self.queue.put(None)
+        if self.thread:
+            self.thread.join(timeout)
+
+    def submit(self, spans):
+        try:
+            self.queue.put_nowait(spans)
+            return True
+        except queue.Full:
+            return False
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(self.path, 'a')
+
+    def _rotate(self):
+        self.file.close()
+        for idx in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{idx}"):
+                os.replace(f"{self.path}.{idx}", f"{self.path}.{idx + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._open()
+
+    def _write(self, spans):
+        if self.file is None:
+            self._open()
+        for span in spans:
+            self.file.write(json.dumps(span.to_dict(), default=str) + '\n')
+        # Flush once per batch rather than per trace
+        if self.queue.empty():
+            self.file.flush()
+        if self.file.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _run(self):
+        while True:
+            spans = self.queue.get()
+            if spans is None:
+                break
+            try:
+                self._write(spans)
+            except Exception as err:
+                logger.error("Failed to export trace", err, sys.exc_info())
+        if self.file:
+            self.file.close()
+            self.file = None
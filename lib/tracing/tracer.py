@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import random
+import threading
+from contextlib import contextmanager
+
+from ..config import SlackBotConfig as config
+from ..logging import SlackBotLogger as logger
+from ..metrics import SlackBotMetrics as metrics
+from .exporter import JSONLExporter
+
+
+class Span(object):
+
+    __slots__ = ['trace_id', 'span_id', 'parent_id', 'name', 'start', 'duration', 'attrs', 'error']
+
+    def __init__(self, trace_id, span_id, parent_id, name, attrs):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.time()
+        self.duration = None
+        self.attrs = attrs
+        self.error = None
+
+    def set(self, key, value):
+        self.attrs[key] = value
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start': self.start,
+            'duration': self.duration,
+            'attrs': self.attrs,
+            'error': self.error,
+        }
+
+
+class _Trace(object):
+
+    def __init__(self):
+        self.trace_id = os.urandom(8).hex()
+        self.spans = []
+        self.stack = []
+
+
+class SlackBotTracer(object):
+    # Traces live in a thread local, so span() is a no-op on threads that
+    # are not handling a sampled message. Finished traces are handed to the
+    # exporter thread whole
+
+    local = threading.local()
+    exporter = None
+    sample_rate = 0.0
+
+    @classmethod
+    def start(cls):
+        if cls.exporter or config.get('enabled') is not True:
+            return None
+        rate = config.get('sample_rate')
+        cls.sample_rate = 1.0 if rate is None else float(rate)
+        cls.exporter = JSONLExporter(
+            config.get('path') or 'traces.jsonl',
+            max_bytes=config.get('max_bytes') or 10 * 1024 * 1024,
+            backups=config.get('backups') or 3,
+            queue_size=config.get('queue_size') or 1000
+        )
+        cls.exporter.start()
+        logger.info(f"Exporting {cls.sample_rate:.0%} of message traces to {cls.exporter.path}")
+        return cls.exporter
+
+    @classmethod
+    def stop(cls):
+        if cls.exporter:
+            cls.exporter.stop()
+            cls.exporter = None
+
+    @classmethod
+    def current(cls):
+        return getattr(cls.local, 'trace', None)
+
+    @classmethod
+    @contextmanager
+    def trace(cls, name, **attrs):
+        if not cls.exporter or cls.current() or random.random() >= cls.sample_rate:
+            yield None
+            return
+        trace = cls.local.trace = _Trace()
+        try:
+            with cls.span(name, **attrs) as span:
+                yield span
+        finally:
+            cls.local.trace = None
+            if not cls.exporter.submit(trace.spans):
+                metrics.inc('slackbot_traces_dropped_total')
+
+    @classmethod
+    @contextmanager
+    def span(cls, name, **attrs):
+        trace = cls.current()
+        if trace is None:
+            yield None
+            return
+        span = Span(
+            trace.trace_id,
+            os.urandom(4).hex(),
+            trace.stack[-1].span_id if trace.stack else None,
+            name,
+            attrs
+        )
+        trace.stack.append(span)
+        start = time.perf_counter()
+        try:
+            yield span
+        except Exception as err:
+            span.error = f"{type(err).__name__}: {err}"
+            raise
+        finally:
+            span.duration = time.perf_counter() - start
+            trace.stack.pop()
+            trace.spans.append(span)
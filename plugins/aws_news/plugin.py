@@ -2,6 +2,7 @@
 
 from lib.builtins import BasePlugin
 from lib.config import SlackBotConfig as config
+from collections import deque
 import feedparser
 
 
@@ -10,9 +11,10 @@ class SlackBotPlugin(BasePlugin):
     def setUp(self):
         self.active_channels = config.get('channels')
         self.feed = 'https://aws.amazon.com/new/feed'
-        self.announced = []
+        # Only the ids of recent items are needed to spot new ones
+        self.announced = deque(maxlen=config.get('history') or 50)
         self.started = False
-        self.client.register_loop(self.check_feeds, interval=30)
+        self.client.register_loop(self.check_feeds, interval=30, leader_only=True)
 
     def _generate_attachment(self, item):
         attachment = {
@@ -23,6 +25,9 @@ class SlackBotPlugin(BasePlugin):
                 }
         return attachment
 
+    def _item_id(self, item):
+        return item.get('id') or item.get('link')
+
     def check_feeds(self):
         if self.started:
             response = feedparser.parse(self.feed)
@@ -30,8 +35,8 @@ class SlackBotPlugin(BasePlugin):
                 last = response['items'][0]
             except IndexError:
                 return
-            if last not in self.announced:
-                self.announced.append(last)
+            if self._item_id(last) not in self.announced:
+                self.announced.append(self._item_id(last))
                 response = self._generate_attachment(last)
                 if response:
                     for channel in self.active_channels:
@@ -44,7 +49,7 @@ class SlackBotPlugin(BasePlugin):
             self.started = True
             response = feedparser.parse(self.feed)
             last = response['items'][0]
-            self.announced.append(last)
+            self.announced.append(self._item_id(last))
 
     def on_recv(self, channel, user, cmd, words):
         pass
@@ -1,16 +1,106 @@
 #!/usr/bin/python3
 
 import os
-import nltk
-from pathlib import Path
-from distutils.dir_util import copy_tree
+import sys
+import time
+import queue
+import sqlite3
+import threading
 from chatterbot import ChatBot
 from chatterbot.trainers import ChatterBotCorpusTrainer
 from chatterbot.conversation import Statement
 
 from lib.builtins import BasePlugin
+from lib.corpus import ensure_nltk_data, normalize
 from lib.config import SlackBotConfig as config
 from lib.logging import SlackBotLogger as logger
+from lib.metrics import SlackBotMetrics as metrics
+
+
+HITS_SCHEMA = """CREATE TABLE IF NOT EXISTS statement_hits (
+    text TEXT PRIMARY KEY,
+    hits INTEGER NOT NULL DEFAULT 0,
+    last_hit REAL NOT NULL
+)"""
+
+
+class StatementMaintenance(object):
+    # Works on the chatterbot SQLite file directly. Corpus statements are
+    # tagged by the trainer, only untagged (learned) ones are pruned, while
+    # duplicates are removed from both
+
+    def __init__(self, db_file, max_age_days=90, min_hits=1, max_statements=200000):
+        self.db_file = db_file
+        self.max_age = max_age_days * 86400
+        self.min_hits = min_hits
+        self.max_statements = max_statements
+        conn = self._connect()
+        try:
+            conn.execute(HITS_SCHEMA)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+        conn.create_function('norm', 1, normalize)
+        return conn
+
+    def record_hits(self, hits):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN")
+            for text, (count, last_hit) in hits.items():
+                conn.execute("INSERT OR IGNORE INTO statement_hits (text, hits, last_hit) VALUES (?, 0, ?)", (text, last_hit))
+                conn.execute(
+                    "UPDATE statement_hits SET hits = hits + ?, last_hit = MAX(last_hit, ?) WHERE text = ?",
+                    (count, last_hit, text)
+                )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def run(self):
+        cutoff = time.time() - self.max_age
+        untagged = "id NOT IN (SELECT statement_id FROM tag_association WHERE statement_id IS NOT NULL)"
+        pruned = {}
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            pruned['duplicate'] = conn.execute(
+                """DELETE FROM statement WHERE id NOT IN (
+                    SELECT MIN(id) FROM statement GROUP BY norm(text), norm(in_response_to)
+                )"""
+            ).rowcount
+            pruned['stale'] = conn.execute(
+                f"""DELETE FROM statement WHERE {untagged}
+                    AND created_at < datetime(?, 'unixepoch')
+                    AND text NOT IN (
+                        SELECT text FROM statement_hits WHERE hits >= ? AND last_hit >= ?
+                    )""",
+                (cutoff, self.min_hits, cutoff)
+            ).rowcount
+            # Still too big, drop the least matched learned statements first
+            excess = conn.execute("SELECT COUNT(*) FROM statement").fetchone()[0] - self.max_statements
+            pruned['size'] = 0
+            if excess > 0:
+                pruned['size'] = conn.execute(
+                    f"""DELETE FROM statement WHERE id IN (
+                        SELECT s.id FROM statement s LEFT JOIN statement_hits h ON h.text = s.text
+                        WHERE s.{untagged}
+                        ORDER BY COALESCE(h.hits, 0), COALESCE(h.last_hit, 0), s.id LIMIT ?
+                    )""",
+                    (excess,)
+                ).rowcount
+            conn.execute("DELETE FROM tag_association WHERE statement_id NOT IN (SELECT id FROM statement)")
+            conn.execute("DELETE FROM statement_hits WHERE text NOT IN (SELECT text FROM statement)")
+            conn.execute("COMMIT")
+            remaining = conn.execute("SELECT COUNT(*) FROM statement").fetchone()[0]
+            conn.execute("REINDEX")
+            conn.execute("ANALYZE")
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+        return pruned, remaining
 
 
 class SlackBotPlugin(BasePlugin):
@@ -23,17 +113,23 @@ class SlackBotPlugin(BasePlugin):
         if data_dir:
             os.makedirs(data_dir, exist_ok=True)
             db_path = f"sqlite:///{os.path.join(data_dir, 'chatdb.sqlite3')}"
-            nltk_dir = os.path.join(data_dir, "nltk_data")
-            nltk.data.path.insert(0, nltk_dir)
-            for pkg in ["wordnet", "stopwords", "averaged_perceptron_tagger"]:
-                nltk.download(pkg, download_dir=nltk_dir)
-            copy_tree(nltk_dir, os.path.join(str(Path.home()), "nltk_data"))
         else:
             db_path = f"sqlite:///db.sqlite3"
+        self.db_file = db_path[len("sqlite:///"):]
+        ensure_nltk_data(["wordnet", "stopwords", "averaged_perceptron_tagger"], data_dir)
         self.contexts = self.client.contexts
+        # Learning is taken off the reply path, exchanges are queued and
+        # written in batches by flush_learned
+        self.learned = queue.Queue(maxsize=config.get('learn_queue_size') or 1000)
+        self.learn_batch_size = config.get('learn_batch_size') or 500
+        self.hits = {}
+        self.hits_lock = threading.Lock()
+        self.db_lock = threading.Lock()
+        self.last_activity = time.monotonic()
         self.chatbot = ChatBot(
             'chatterbot',
             database_uri=db_path,
+            read_only=True,
             logic_adapters=[
                 'chatterbot.logic.BestMatch',
                 'chatterbot.logic.MathematicalEvaluation',
@@ -41,6 +137,83 @@ class SlackBotPlugin(BasePlugin):
             ]
         )
         self.initial_training()
+        self.client.register_loop(self.flush_learned, interval=config.get('learn_interval') or 5)
+        opts = config.get('maintenance') or {}
+        self.maintenance = StatementMaintenance(
+            self.db_file,
+            max_age_days=opts.get('max_age_days') or 90,
+            min_hits=opts.get('min_hits') or 1,
+            max_statements=opts.get('max_statements') or 200000
+        )
+        self.maintenance_interval = opts.get('interval') or 86400
+        self.quiet_period = opts.get('quiet_period') or 600
+        self.last_maintenance = time.monotonic()
+        self.client.register_loop(self.run_maintenance, interval=min(self.maintenance_interval, self.quiet_period))
+
+    def tearDown(self):
+        self.flush_learned()
+
+    def learn(self, text, response, in_response_to=None):
+        for statement in [
+            Statement(text=text, in_response_to=in_response_to),
+            Statement(text=response.text, in_response_to=text, conversation=response.conversation)
+        ]:
+            try:
+                self.learned.put_nowait(statement)
+            except queue.Full:
+                metrics.inc('slackbot_chatterbot_learn_dropped_total')
+        with self.hits_lock:
+            count, _ = self.hits.get(response.text, (0, 0))
+            self.hits[response.text] = (count + 1, time.time())
+        metrics.set('slackbot_chatterbot_learn_queue_depth', self.learned.qsize())
+
+    def flush_learned(self):
+        with self.db_lock:
+            self._flush_learned()
+
+    def _flush_learned(self):
+        with self.hits_lock:
+            hits, self.hits = self.hits, {}
+        if hits:
+            try:
+                self.maintenance.record_hits(hits)
+            except Exception as err:
+                logger.error("Failed to record statement hits", err, sys.exc_info())
+        while not self.learned.empty():
+            batch = []
+            while len(batch) < self.learn_batch_size:
+                try:
+                    batch.append(self.learned.get_nowait())
+                except queue.Empty:
+                    break
+            start = time.perf_counter()
+            try:
+                self.chatbot.storage.create_many(batch)
+                metrics.inc('slackbot_chatterbot_learned_total', len(batch))
+            except Exception as err:
+                metrics.inc('slackbot_chatterbot_learn_dropped_total', len(batch))
+                logger.error("Failed to store learned statements", err, sys.exc_info())
+            metrics.observe('slackbot_chatterbot_commit_seconds', time.perf_counter() - start)
+        metrics.set('slackbot_chatterbot_learn_queue_depth', self.learned.qsize())
+
+    def run_maintenance(self):
+        now = time.monotonic()
+        if now - self.last_maintenance < self.maintenance_interval:
+            return
+        if now - self.last_activity < self.quiet_period:
+            logger.debug("Postponing chatterbot maintenance, conversations are active")
+            return
+        with self.db_lock:
+            self._flush_learned()
+            start = time.perf_counter()
+            pruned, remaining = self.maintenance.run()
+        elapsed = time.perf_counter() - start
+        self.last_maintenance = time.monotonic()
+        for reason, count in pruned.items():
+            metrics.inc('slackbot_chatterbot_pruned_total', count, reason=reason)
+        metrics.set('slackbot_chatterbot_statements', remaining)
+        metrics.observe('slackbot_chatterbot_maintenance_seconds', elapsed)
+        logger.info(f"Chatterbot maintenance pruned {pruned}, {remaining} statements left ({elapsed:.1f}s)")
 
     def initial_training(self):
         self.trainer = ChatterBotCorpusTrainer(self.chatbot)
@@ -49,14 +222,15 @@ class SlackBotPlugin(BasePlugin):
         )
 
     def on_context(self, channel, user, ctx, words):
-        if ctx.get('last_statement'):
-            inp = Statement(
-                text=' '.join(words),
-                in_response_to=str(ctx.get('last_statement')),
-            )
+        self.last_activity = time.monotonic()
+        text = ' '.join(words)
+        last_statement = str(ctx.get('last_statement')) if ctx.get('last_statement') else None
+        if last_statement:
+            inp = Statement(text=text, in_response_to=last_statement)
         else:
-            inp = Statement(text=' '.join(words))
+            inp = Statement(text=text)
         response = self.chatbot.get_response(inp)
+        self.learn(text, response, last_statement)
         ctx.set('last_statement', response)
         return str(response)
 
@@ -71,6 +245,8 @@ class SlackBotPlugin(BasePlugin):
         if 'lets chat' in message.replace("'", "").lower():
             ctx = self.contexts.new_context(channel, user['id'], messages=[words], timeout=120)
             return "Okay, I'm ready!"
+        self.last_activity = time.monotonic()
         logger.info("Receiving response from chatterbot")
         response = self.chatbot.get_response(message)
+        self.learn(message, response)
         return str(response)
@@ -1,6 +1,7 @@
 #!/usr/bin/python3
 
 from lib.builtins import BasePlugin
+from lib.tracing import SlackBotTracer as tracer
 from datetime import datetime
 import requests
 import json
@@ -25,7 +26,11 @@ class SlackBotPlugin(BasePlugin):
         pass
 
     def do(self, url):
-        return requests.get(url).json()
+        with tracer.span('http', method='GET', url=url) as span:
+            response = requests.get(url)
+            if span:
+                span.set('status', response.status_code)
+            return response.json()
 
     def get_worldwide(self):
         return self.do(f"{BASE_URL}/all")
@@ -1,7 +1,7 @@
 #!/usr/bin/python3
 
 from lib.builtins import BasePlugin
-import random
+from lib.corpus import LineCorpus
 import os
 
 basedir = os.path.dirname(os.path.realpath(__file__))
@@ -17,13 +17,10 @@ class SlackBotPlugin(BasePlugin):
         self._populate_excuses()
 
     def _populate_excuses(self):
-        with open(excuse_path, 'r') as f:
-            data = f.read()
-        self.excuses = data.splitlines()
+        self.excuses = LineCorpus(excuse_path)
 
     def on_trigger(self, channel, user, words):
         pass
 
     def on_recv(self, channel, user, cmd, words):
-        secure_random = random.SystemRandom()
-        return secure_random.choice(self.excuses).strip()
+        return self.excuses.random_line()
@@ -1,11 +1,20 @@
 #!/usr/bin/python3
 
 from lib.builtins import BasePlugin
+from lib.cache import TTLCache, SingleFlight
 from lib.config import SlackBotConfig as config
+from lib.corpus import normalize
+from lib.logging import SlackBotLogger as logger
+from lib.tracing import SlackBotTracer as tracer
+from datetime import date
+import threading
 import requests
 import json
 
 
+NO_RESULTS = False
+
+
 class SlackBotPlugin(BasePlugin):
 
     hooks = ['google']
@@ -15,6 +24,16 @@ class SlackBotPlugin(BasePlugin):
         self.api_key = config.get('api_key')
         self.engine_id = config.get('search_engine_id')
         self.base_url = 'https://www.googleapis.com/customsearch/v1'
+        self.db = self.client.db
+        self.daily_quota = config.get('daily_quota') or 100
+        self.quota_reserve = config.get('quota_reserve') or 5
+        self.timeout = config.get('timeout') or 10
+        self.cache = TTLCache(
+            maxsize=config.get('cache_size') or 256,
+            ttl=config.get('cache_ttl') or 3600
+        )
+        self.inflight = SingleFlight()
+        self.quota_lock = threading.Lock()
 
     def _generate_attachment(self, item):
         attachment = {
@@ -25,23 +44,72 @@ class SlackBotPlugin(BasePlugin):
                 }
         return attachment
 
+    def _quota_used(self):
+        quota = self.db.get_value('quota') or {}
+        if quota.get('date') != date.today().isoformat():
+            return 0
+        return quota.get('used', 0)
+
+    def _take_quota(self):
+        with self.quota_lock:
+            used = self._quota_used()
+            if used >= self.daily_quota - self.quota_reserve:
+                return False
+            self.db.store_value('quota', {
+                'date': date.today().isoformat(),
+                'used': used + 1
+            })
+            return True
+
+    def _search(self, query):
+        cached = self.cache.get(query)
+        if cached is not None:
+            return cached
+        if not self._take_quota():
+            stale = self.cache.get(query, allow_stale=True)
+            if stale is not None:
+                logger.info(f"Search quota nearly exhausted, serving stale result for '{query}'")
+                return stale
+            return None
+        with tracer.span('http', method='GET', url=self.base_url) as span:
+            response = requests.get(self.base_url, params={
+                'q': query,
+                'cx': self.engine_id,
+                'key': self.api_key
+            }, timeout=self.timeout)
+            if span:
+                span.set('status', response.status_code)
+        # Error bodies have no items either, they must not be cached as
+        # "no results"
+        response.raise_for_status()
+        items = json.loads(response.content).get('items')
+        if items:
+            result = self._generate_attachment(items[0])
+        else:
+            result = NO_RESULTS
+        self.cache.set(query, result)
+        return result
+
     def query(self, query):
-        search_url = '%s?q=%s&cx=%s&key=%s' % (
-                self.base_url,
-                query,
-                self.engine_id,
-                self.api_key
-                )
-        response = requests.get(search_url)
-        lucky = json.loads(response.content)['items'][0]
-        attachment = self._generate_attachment(lucky)
-        return attachment
+        # Google ignores case and most punctuation, so queries that only
+        # differ in those share a cache entry and a request
+        query = normalize(query)
+        return self.inflight.do(query, self._search, query)
 
     def on_recv(self, channel, user, cmd, words):
-        response = self.query(' '.join(words))
-        if response:
-            self.client.send_channel_message(
-                channel,
-                '',
-                [response]
-            )
+        if len(words) == 0:
+            return self.client.get_help_page('google')
+        try:
+            response = self.query(' '.join(words))
+        except requests.RequestException as err:
+            logger.info(f"Google search failed: {err}")
+            return "Google search failed, try again in a bit"
+        if response is None:
+            return "I've used up my search quota for today, try again tomorrow"
+        if response is NO_RESULTS:
+            return "I couldn't find anything for that"
+        self.client.send_channel_message(
+            channel,
+            '',
+            [response]
+        )
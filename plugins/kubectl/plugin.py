@@ -3,19 +3,25 @@
 import re
 
 from lib.builtins import BasePlugin
+from lib.config import SlackBotConfig as config
+from lib.corpus import ensure_nltk_data
 from lib.logging import SlackBotLogger as logger
+from lib.kube import FanOut, ResourceCache, RESOURCES, load_kubeconfig
 
 from nltk.corpus import stopwords
+from prettytable import PrettyTable
 
 
-KEYWORDS = [
-    "pod", "pods",
-    "deployment", "deployments",
-    "service", "services",
-    "namespace", "namespaces"
-]
-trigger_regex_string = r"pods?|deployments?|services?"
+KEYWORDS = {
+    "pod": "pods", "pods": "pods",
+    "deployment": "deployments", "deployments": "deployments",
+    "service": "services", "services": "services",
+    "namespace": "namespace", "namespaces": "namespaces"
+}
+trigger_regex_string = r"pods?|deployments?|services?|namespaces"
 trigger_regex = re.compile(trigger_regex_string)
+MORE_WORDS = ["next", "more"]
+LABEL_WORDS = ["label", "labels", "labeled", "labelled"]
 
 
 class SlackBotPlugin(BasePlugin):
@@ -24,7 +30,33 @@ class SlackBotPlugin(BasePlugin):
     trigger_regexes = [trigger_regex_string]
 
     def setUp(self):
+        # stopwords are read on every message, don't register before they exist
+        ensure_nltk_data(["stopwords"], config.get('data_dir'))
         self.contexts = self.client.contexts
+        self.page_size = config.get('page_size') or 50
+        self.cursor_timeout = config.get('cursor_timeout') or 300
+        self.caches = []
+        # contexts is a list of kubeconfig contexts or 'all', context a
+        # single one. Without either only the current-context is used
+        contexts = config.get('contexts')
+        if not contexts and config.get('context'):
+            contexts = [config.get('context')]
+        clusters = load_kubeconfig(config.get('kubeconfig'), contexts)
+        for cluster in clusters:
+            cache = ResourceCache(
+                cluster,
+                resources=config.get('resources'),
+                max_objects=config.get('max_objects') or 20000
+            )
+            cache.start()
+            self.caches.append(cache)
+        self.fanout = FanOut(self.caches, deadline=config.get('deadline') or 3.0)
+        logger.info(f"Watching {', '.join(x.name for x in self.caches)}")
+
+    def tearDown(self):
+        for cache in self.caches:
+            cache.stop()
+        self.fanout.shutdown()
 
     def get_action(self, words):
         if "get" in words:
@@ -35,26 +67,32 @@ class SlackBotPlugin(BasePlugin):
             return "describe", [word for word in words if word != "describe"]
         return None, None
 
+    def _value_near(self, args, idx, used):
+        # Prefer the word after a keyword ("pod web-1"), then the one before
+        # it ("web-1 pod"), skipping keywords and words already claimed
+        for pos in [idx + 1, idx - 1]:
+            if 0 <= pos < len(args) and args[pos] not in KEYWORDS and pos not in used:
+                used.add(pos)
+                return args[pos]
+        return None
+
     def set_context_args(self, ctx, args):
+        # key=value words are label selectors, "pods with label app=web"
+        selector = [x for x in args if '=' in x]
+        if selector:
+            ctx.set("selector", ','.join(selector))
+        args = [x for x in args if '=' not in x and x not in LABEL_WORDS]
+        used = set()
+        for idx, token in enumerate(args):
+            if KEYWORDS.get(token) == "namespace":
+                ctx.set("namespace", self._value_near(args, idx, used))
         for idx, token in enumerate(args):
-            if token in KEYWORDS:
-                if idx == 0:
-                    val = args[1] if args[1] not in KEYWORDS else None
-                    if val:
-                        ctx.set(token, val)
-                    continue
-                if idx == len(args)-1:
-                    val = args[-2] if args[-2] not in KEYWORDS else None
-                    if val:
-                        ctx.set(token, val)
-                    break
-                val = args[idx-1] if args[idx-1] not in KEYWORDS else None
-                if val:
-                    ctx.set(token, val)
-                    continue
-                val = args[idx+1] if args[idx+1] not in KEYWORDS else None
-                if val:
-                    ctx.set(token, val)
+            resource = KEYWORDS.get(token)
+            if resource and resource != "namespace":
+                ctx.set("resource", resource)
+                if resource != "namespaces":
+                    ctx.set("name", self._value_near(args, idx, used))
+                break
         return ctx
 
     def strip_stop_words(self, words):
@@ -62,6 +100,15 @@ class SlackBotPlugin(BasePlugin):
         trimmed = [word for word in words if word not in stwords and word != self.client.at_bot]
         return trimmed
 
+    def next_question(self, ctx):
+        if ctx.get("resource") != "namespaces" and not ctx.get("namespace"):
+            ctx.set("question", "namespace")
+            return "Which namespace am I looking in?"
+        if ctx.get("action") == "describe" and ctx.get("resource") != "namespaces" and not ctx.get("name"):
+            ctx.set("question", "name")
+            return f"Which of the {ctx.get('resource')} should I describe?"
+        return None
+
     def on_trigger(self, channel, user, words):
         if not self.client.is_mention(words):
             return
@@ -69,24 +116,128 @@ class SlackBotPlugin(BasePlugin):
         action, args = self.get_action(trimmed)
         if not action:
             return "Sorry, I didn't understand what you wanted to do"
+        if action == "delete":
+            return "I only read from the cluster, delete it with kubectl yourself"
 
-        if len(args) == 1:
+        if not args:
             return "Sorry, that's not enough to go on..."
 
         ctx = self.contexts.new_context(channel, user['id'], messages=[words])
         ctx.set("action", action)
-        ctx.set("resource", trigger_regex.search(' '.join(args)).group(0))
         ctx = self.set_context_args(ctx, args)
-        if not ctx.get("namespace"):
-            ctx.set("question", "namespace")
-            return "Which namespace am I looking in?"
-        logger.info(ctx.values)
+        if not ctx.get("resource"):
+            ctx.finish()
+            return "Sorry, I can only look up pods, deployments, services and namespaces"
+        question = self.next_question(ctx)
+        if question:
+            return question
+        return self.answer(ctx)
 
     def on_context(self, channel, user, ctx, words):
+        if ctx.get("cursor"):
+            if len(words) == 1 and words[0].lower() in MORE_WORDS:
+                return self.next_page(ctx)
+            # Anything else ends the listing and goes through the usual
+            # dispatch, it may well be a new question
+            ctx.finish()
+            return None
         trimmed = self.strip_stop_words(words)
-        if ctx.get("question") and ctx.get("question") == "namespace":
+        question = ctx.get("question")
+        if question:
             if len(trimmed) != 1:
                 return "Sorry I didn't catch that..."
-            ctx.set("namespace", trimmed[0])
+            ctx.set(question, trimmed[0])
             ctx.set("question", None)
-        logger.info(ctx.values)
+        question = self.next_question(ctx)
+        if question:
+            return question
+        return self.answer(ctx)
+
+    def _query(self, cache, resource, namespace, name, selector):
+        if not cache.has(resource):
+            return []
+        return cache.query(resource, namespace, name, selector, timeout=self.fanout.deadline)
+
+    def answer(self, ctx):
+        resource = ctx.get("resource")
+        namespace = ctx.get("namespace")
+        name = ctx.get("name")
+        selector = ctx.get("selector")
+        result = self.fanout.query(self._query, resource, namespace, name, selector)
+        found = [
+            (cluster, summary)
+            for cluster in sorted(result.results)
+            for summary in result.results[cluster]
+        ]
+        if ctx.get("action") == "describe":
+            if not found:
+                reply = f"No {resource} named `{name}` in `{namespace}`"
+            else:
+                reply = '\n'.join(self.describe(summary, cluster) for cluster, summary in found)
+        elif not found:
+            reply = f"No {resource} found in `{namespace}`" if namespace else f"No {resource} found"
+            if selector:
+                reply += f" matching `{selector}`"
+        else:
+            return self.first_page(ctx, resource, found, self.partial_note(result))
+        ctx.finish()
+        return reply + self.partial_note(result)
+
+    def first_page(self, ctx, resource, found, note):
+        # Only the rendered rows are kept on the context, later pages are
+        # served from them without touching the caches again
+        rows = [self.row(resource, cluster, summary) for cluster, summary in found]
+        if len(rows) > self.page_size:
+            ctx.set("cursor", {"header": self.header(resource), "rows": rows, "offset": 0, "note": note})
+            return self.next_page(ctx)
+        ctx.finish()
+        return self.table(self.header(resource), rows) + note
+
+    def next_page(self, ctx):
+        cursor = ctx.get("cursor")
+        start = cursor["offset"]
+        rows = cursor["rows"][start:start + self.page_size]
+        cursor["offset"] = start + len(rows)
+        total = len(cursor["rows"])
+        reply = self.table(cursor["header"], rows)
+        reply += f"\n_Showing {start + 1}-{cursor['offset']} of {total}_"
+        if cursor["offset"] >= total:
+            ctx.set("cursor", None)
+            ctx.finish()
+            return reply + cursor["note"]
+        # Written back so the offset sticks when running in a worker
+        ctx.set("cursor", cursor)
+        ctx.extend(self.cursor_timeout)
+        return reply + ", say `next` for more" + cursor["note"]
+
+    def partial_note(self, result):
+        notes = [f"`{x}` timed out after {self.fanout.deadline:g}s" for x in sorted(result.timed_out)]
+        notes += [f"`{x}` failed: {err}" for x, err in sorted(result.errors.items())]
+        if not notes:
+            return ""
+        return "\n_Partial results: " + ', '.join(notes) + "_"
+
+    def header(self, resource):
+        multi = len(self.caches) > 1
+        return (['CLUSTER'] if multi else []) + [x[0] for x in RESOURCES[resource].columns]
+
+    def row(self, resource, cluster, summary):
+        multi = len(self.caches) > 1
+        return ([cluster] if multi else []) + RESOURCES[resource].row(summary)
+
+    def table(self, header, rows):
+        t = PrettyTable(header)
+        t.align = 'l'
+        for row in rows:
+            t.add_row(row)
+        return f"```\n{t}\n```"
+
+    def describe(self, summary, cluster):
+        lines = [f"{'Cluster:':<12} {cluster}"] if len(self.caches) > 1 else []
+        for key, value in summary.items():
+            if isinstance(value, dict):
+                value = ','.join(f"{k}={v}" for k, v in value.items()) or '<none>'
+            elif isinstance(value, list):
+                value = ', '.join(str(x) for x in value) or '<none>'
+            lines.append(f"{key.replace('_', ' ').title() + ':':<12} {value}")
+        return "```\n" + '\n'.join(lines) + "\n```"
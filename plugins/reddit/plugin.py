@@ -18,7 +18,7 @@ class SlackBotPlugin(BasePlugin):
         self.started = False
         for sub in self.subreddits:
             self.feeds[sub] = 'https://www.reddit.com/r/%s/new/.rss' % sub
-        self.client.register_loop(self.check_feeds, interval=30)
+        self.client.register_loop(self.check_feeds, interval=30, leader_only=True)
 
     def _generate_attachment(self, item, link):
         base_url = "{0.scheme}://{0.netloc}/".format(urlsplit(link))
@@ -49,48 +49,44 @@ class SlackBotPlugin(BasePlugin):
         else:
             return None
 
+    def _record(self, latest):
+        # Runs under the db lock and may be retried, so it only builds new
+        # lists and leaves working out what to announce to the caller
+        def record(current):
+            updated = {}
+            for sub, item in latest.items():
+                announced = current.get(sub) or []
+                if item['title'] in announced:
+                    continue
+                updated[sub] = (announced + [item['title']])[-10:]
+            return updated
+        return record
+
     def check_feeds(self):
-        if self.started:
-            for sub, feed in self.feeds.items():
-                response = feedparser.parse(feed)
-                try:
-                    last = response['items'][0]
-                except IndexError:
-                    return
-                announced = self.db.get_value(sub)
-                if not announced or last['title'] not in announced:
-                    if not announced:
-                        announced = [last['title']]
-                    else:
-                        if len(announced) >= 10:
-                            del announced[0]
-                        announced.append(last['title'])
-                    response = self._parse_item(last)
-                    if response:
-                        for channel in self.active_channels:
-                            self.client.send_channel_message(
-                                channel,
-                                '',
-                                [response]
-                            )
-                    self.db.store_value(sub, announced)
-        else:
+        latest = {}
+        for sub, feed in self.feeds.items():
+            response = feedparser.parse(feed)
+            try:
+                latest[sub] = response['items'][0]
+            except IndexError:
+                continue
+        if not latest:
+            return
+        # One lock and one persist for the whole cycle
+        updated = self.db.update_many(list(latest), self._record(latest)) or {}
+        if not self.started:
+            # The first cycle only remembers what is already there
             self.started = True
-            for sub, feed in self.feeds.items():
-                announced = self.db.get_value(sub)
-                response = feedparser.parse(feed)
-                try:
-                    last = response['items'][0]
-                    if announced:
-                        if len(announced) >= 10:
-                            del announced[0]
-                        if last['title'] not in announced:
-                            announced.append(last['title'])
-                    else:
-                        announced = [last['title']]
-                    self.db.store_value(sub, announced)
-                except IndexError:
-                    return
+            return
+        for sub in updated:
+            response = self._parse_item(latest[sub])
+            if response:
+                for channel in self.active_channels:
+                    self.client.send_channel_message(
+                        channel,
+                        '',
+                        [response]
+                    )
 
     def on_recv(self, channel, user, cmd, words):
         pass